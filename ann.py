@@ -0,0 +1,133 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index over a VectorIndex matrix.
+
+Rows are clustered with spherical k-means; a query only scores the rows of its
+`nprobe` closest clusters. Raising nprobe trades latency for recall, nprobe == nlist
+is exact search. The index is stored as ivf.npz inside the index directory:
+
+    python ann.py embeddings/discourse_index --nlist 256
+"""
+import argparse
+import os
+
+import numpy as np
+
+IVF_FILE = "ivf.npz"
+ASSIGN_BLOCK_ROWS = 65536
+
+
+def _assign(matrix, centroids):
+    """Closest centroid (max cosine) for every row, computed block by block."""
+    labels = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), ASSIGN_BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors, nlist, iterations=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(vectors, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+        # Sum rows per cluster with one reduceat over the rows sorted by label
+        order = np.argsort(labels, kind="stable")
+        present = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[present]
+        sums = np.zeros_like(centroids)
+        sums[present] = np.add.reduceat(vectors[order], starts, axis=0)
+        # Re-seed empty clusters with random rows instead of letting them die
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    def __init__(self, centroids, list_offsets, list_ids, nprobe=8):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrix, nlist=0, iterations=20, sample_size=0, seed=0):
+        """
+        Cluster an (N, D) normalized matrix. nlist=0 picks ~4*sqrt(N) lists; k-means is
+        trained on a sample (default 64 rows per list) and then every row is assigned.
+        """
+        n = len(matrix)
+        if n == 0:
+            raise ValueError("cannot build an IVF index over an empty matrix")
+        nlist = min(n, nlist or max(1, int(4 * np.sqrt(n))))
+        sample_size = min(n, sample_size or 64 * nlist)
+
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(n, sample_size, replace=False))
+        sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+        centroids = spherical_kmeans(sample, nlist, iterations, seed)
+
+        return cls.from_centroids(matrix, centroids)
+
+    @classmethod
+    def from_centroids(cls, matrix, centroids):
+        """Fill the inverted lists for existing centroids (one assignment pass, no k-means)."""
+        labels = _assign(matrix, centroids)
+        list_ids = np.argsort(labels, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(centroids)), out=list_offsets[1:])
+        return cls(centroids, list_offsets, list_ids)
+
+    def probe(self, query, nprobe=None):
+        """Row ids of the nprobe lists whose centroids are closest to the query."""
+        nprobe = min(self.nlist, nprobe or self.nprobe)
+        centroid_scores = self.centroids @ query
+        if nprobe < self.nlist:
+            lists = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            lists = np.arange(self.nlist)
+        return np.concatenate([
+            self.list_ids[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists
+        ])
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, list_offsets=self.list_offsets, list_ids=self.list_ids)
+
+    @classmethod
+    def load(cls, path, nprobe=8):
+        data = np.load(path)
+        return cls(data["centroids"], data["list_offsets"], data["list_ids"], nprobe)
+
+
+def build_ivf(index_dir, nlist=0, centroids=None):
+    """
+    Build and persist ivf.npz next to the embeddings of an index directory. Passing the
+    centroids of a previous build only re-assigns rows, which is enough after a small patch.
+    """
+    matrix = np.load(os.path.join(index_dir, "embeddings.npy"), mmap_mode="r")
+    if len(matrix) == 0:
+        print(f"⚠️ Skipping IVF build for empty index {index_dir}")
+        return None
+    if centroids is not None and centroids.shape[1] == matrix.shape[1]:
+        ivf = IVFIndex.from_centroids(matrix, centroids)
+    else:
+        ivf = IVFIndex.build(matrix, nlist)
+    ivf.save(os.path.join(index_dir, IVF_FILE))
+    print(f"✅ Built IVF index with {ivf.nlist} lists for {len(matrix)} rows in {index_dir}")
+    return ivf
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an IVF index for an index directory")
+    parser.add_argument("index_dir")
+    parser.add_argument("--nlist", type=int, default=0, help="number of lists (0 = ~4*sqrt(N))")
+    args = parser.parse_args()
+    build_ivf(args.index_dir, args.nlist)
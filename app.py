@@ -1,16 +1,35 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
+from contextlib import asynccontextmanager
 import asyncio
+import binascii
 import json
 import base64
+import os
 
 # Your existing imports
-from embed import (get_embeddings, generate_answer, describe_base64_image)
-from config import OPEN_API_KEY
-from helper import (load_embeddings, extract_europe1_urls, image_url_to_base64)
-from get_answer import find_similar_content, parse_llm_response
+from embed import (get_embeddings_batch, generate_answer, generate_answer_stream, describe_image_bytes)
+from config import (OPEN_API_KEY, SEARCH_MODE, IVF_NPROBE, EMBEDDING_CACHE_PATH,
+                    EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_MEMORY_ENTRIES, CACHE_BUSY_TIMEOUT,
+                    ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES,
+                    OCR_CACHE_PATH, OCR_CACHE_MAX_ENTRIES, RETRIEVAL_MODE, HYBRID_LEXICAL_WEIGHT,
+                    EMBEDDING_DEADLINE, QUANTIZATION, QUANTIZED_SHORTLIST, QUERY_BATCH_WINDOW_MS,
+                    QUERY_BATCH_MAX)
+from helper import (load_embeddings, extract_europe1_urls, fetch_image_base64)
+from get_answer import find_similar_content, find_similar_content_batch, merge_results, parse_llm_response, StreamingAnswerParser
+from search import VectorIndex
+from index_store import load_index
+from lexical import BM25Index
+from http_client import create_client
+from batcher import MicroBatcher
+from singleflight import SingleFlight, request_key
+from image_prep import ImageTooLarge, check_base64_size, image_stats
+from cache import EmbeddingCache, OCRCache, SemanticAnswerCache, image_key, result_set_key
+from metrics import (LEXICAL_FALLBACKS, ServerTimingMiddleware, add_timings, collect_timings, sample_lines,
+                     render, span)
 
 # Pydantic models for request/response
 class QueryRequest(BaseModel):
@@ -21,8 +40,37 @@ class QueryResponse(BaseModel):
     answer: str
     links: list
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global discourse_index, markdown_index
+    # Indexes load here, not at import, so importing the app stays cheap; the two memory
+    # maps (or legacy .npz files) are opened concurrently off the event loop
+    discourse_index, markdown_index = await asyncio.gather(asyncio.to_thread(load_search_index, "discourse"),
+                                                           asyncio.to_thread(load_search_index, "markdown"))
+    # One pooled keep-alive client for every upstream call made while serving
+    app.state.http_client = create_client()
+    # Repeated questions skip the embedding round-trip
+    app.state.embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES,
+                                               EMBEDDING_CACHE_MEMORY_ENTRIES, CACHE_BUSY_TIMEOUT)
+    # The same screenshot pasted into many questions is only described once
+    app.state.ocr_cache = OCRCache(OCR_CACHE_PATH, OCR_CACHE_MAX_ENTRIES, timeout=CACHE_BUSY_TIMEOUT)
+    # Near-identical questions that retrieve the same chunks reuse the stored answer
+    app.state.answer_cache = SemanticAnswerCache(ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES)
+    # Concurrent questions share one /embeddings request and one batched search
+    app.state.query_batcher = MicroBatcher(embed_and_search_batch, QUERY_BATCH_WINDOW_MS / 1000, QUERY_BATCH_MAX)
+    # Identical questions (same text and image) in flight at once share one pipeline run
+    app.state.inflight_retrievals = SingleFlight()
+    app.state.inflight_answers = SingleFlight()
+    try:
+        yield
+    finally:
+        await app.state.query_batcher.close()
+        await app.state.http_client.aclose()
+        app.state.embedding_cache.close()
+        app.state.ocr_cache.close()
+
 # Initialize FastAPI app
-app = FastAPI(title="RAG Query API", description="Simple API for querying with optional images")
+app = FastAPI(title="RAG Query API", description="Simple API for querying with optional images", lifespan=lifespan)
 
 # Optional: Add CORS middleware if needed
 app.add_middleware(
@@ -31,62 +79,308 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients read the per-stage timings
+    expose_headers=["Server-Timing"],
 )
+# Per-stage timings of each request as a Server-Timing header (see metrics.py)
+app.add_middleware(ServerTimingMiddleware)
 
-# Load embeddings once at startup
-discourse_embeddings = load_embeddings('embeddings/discourse_embeddings.npz')
-markdown_embeddings = load_embeddings('embeddings/markdown_embeddings.npz')
+def load_search_index(source):
+    # Prefer the memory-mapped index directory; fall back to the legacy .npz file
+    index_dir = f'embeddings/{source}_index'
+    if os.path.exists(os.path.join(index_dir, 'meta.json')):
+        return load_index(index_dir, SEARCH_MODE, IVF_NPROBE, QUANTIZATION, QUANTIZED_SHORTLIST)
+    if SEARCH_MODE != "exact" or QUANTIZATION != "none":
+        print(f"⚠️ No index directory for {source}, using exact search over the legacy .npz")
+    npz_path = f'embeddings/{source}_embeddings.npz'
+    index = VectorIndex.from_npz(load_embeddings(npz_path), source)
+    index.lexical = BM25Index.build(index.chunks)
+    return index
 
-async def process_query(question: str, image_base64: Optional[str] = None):
+# Number of retrieved chunks passed to the answer model
+CONTEXT = 10
+
+# Loaded once at startup by the lifespan handler
+discourse_index = None
+markdown_index = None
+
+async def embed_and_search_batch(questions):
     """
-    Modified version of your result_response function
+    (query embedding, results, stage timings) per question: one /embeddings request, one
+    search batch. Every question in the batch waited for all of it, so they share the timings.
+    """
+    with collect_timings() as timings:
+        with span("embedding"):
+            embeddings = await get_embeddings_batch(questions, OPEN_API_KEY, client=app.state.http_client,
+                                                    cache=app.state.embedding_cache)
+        if RETRIEVAL_MODE == "hybrid":
+            results = [find_similar_content(embedding, CONTEXT, discourse_index, markdown_index,
+                                            question=question, lexical_weight=HYBRID_LEXICAL_WEIGHT)
+                       for embedding, question in zip(embeddings, questions)]
+        else:
+            results = find_similar_content_batch(embeddings, CONTEXT, discourse_index, markdown_index)
+    return [(embedding, question_results, timings) for embedding, question_results in zip(embeddings, results)]
+
+async def embed_and_search(question: str):
+    """
+    (query embedding, results). The question is embedded and searched together with any
+    others arriving at the same time (see batcher.py). If that fails or misses
+    EMBEDDING_DEADLINE, results come from the BM25 indexes alone and the embedding is None.
     """
     try:
-        CONTEXT = 10
-        
-        # Handle image processing
+        embedding, results, timings = await asyncio.wait_for(app.state.query_batcher.submit(question),
+                                                             EMBEDDING_DEADLINE or None)
+        add_timings(timings)
+        return embedding, results
+    except Exception as e:
+        LEXICAL_FALLBACKS.inc()
+        print(f"⚠️ Query embedding unavailable ({type(e).__name__}: {e}), using lexical retrieval")
+    return None, find_similar_content(None, CONTEXT, discourse_index, markdown_index, question=question)
+
+def decode_image(base64_img: str):
+    """(image bytes, OCR cache key) for a base64 image."""
+    image_bytes = base64.b64decode(base64_img)
+    return image_bytes, image_key(image_bytes)
+
+async def describe_image(base64_img: str, question: str, url: Optional[str] = None):
+    """OCR description of an image, served from the OCR cache when the same bytes were seen before."""
+    ocr_cache = app.state.ocr_cache
+    check_base64_size(base64_img)
+    # Decoding and hashing a large upload take ~100 ms, and the store may be locked by an
+    # ingestion run: do both in worker threads, once per image
+    image_bytes, key = await asyncio.to_thread(decode_image, base64_img)
+    description = await asyncio.to_thread(ocr_cache.get_description, key)
+    if description is None:
+        with span("ocr"):
+            description = await describe_image_bytes(image_bytes, OPEN_API_KEY, 3, question=question,
+                                                     client=app.state.http_client)
+        await asyncio.to_thread(ocr_cache.set_description, description, key, url)
+    elif url is not None:
+        await asyncio.to_thread(ocr_cache.set_description, description, url=url)
+    return description
+
+async def describe_image_url(url: str, question: str):
+    description = await asyncio.to_thread(app.state.ocr_cache.get_by_url, url)
+    if description is not None:
+        return description
+    with span("image_fetch"):
+        base64_img = await fetch_image_base64(url, app.state.http_client)
+    if not base64_img:
+        return None
+    return await describe_image(base64_img, question, url)
+
+async def retrieve_context(question: str, image_base64: Optional[str] = None):
+    """
+    Shared first half of a query: describe the image (if any), embed and search.
+    Returns (question with image description, query embedding, relevant results).
+
+    The text-only question is embedded and searched while the image is being described;
+    the image-augmented question is searched afterwards and both candidate sets merged.
+    """
+    image_task = None
+    if image_base64:
+        # If image is provided directly as base64
+        image_task = asyncio.create_task(describe_image(image_base64, question))
+    else:
+        # Try to extract URLs from question if no direct image provided
+        url = extract_europe1_urls(question)
+        if url:
+            image_task = asyncio.create_task(describe_image_url(url[0], question))
+    
+    try:
+        embedding_response, relevant_results = await embed_and_search(question)
+    except BaseException:
+        if image_task:
+            image_task.cancel()
+        raise
+    if image_task is None:
+        return question, embedding_response, relevant_results
+    
+    try:
+        img_description = await image_task
+    except Exception:
         if image_base64:
-            # If image is provided directly as base64
-            img_description = await describe_base64_image(image_base64, OPEN_API_KEY, 3, question=question)
-            question = question + " " + img_description
-        else:
-            # Try to extract URLs from question if no direct image provided
-            try:
-                url = extract_europe1_urls(question)
-                if url:
-                    base64_img = image_url_to_base64(url[0])
-                    img_description = await describe_base64_image(base64_img, OPEN_API_KEY, 3, question=question)
-                    question = question + " " + img_description
-            except:
-                # Continue without image if extraction fails
-                pass
-        
-        # Generate embeddings
-        embedding_response = await get_embeddings(question, OPEN_API_KEY)
+            raise
+        # Continue without image if a linked image can't be fetched or described
+        img_description = None
+    if not img_description:
+        return question, embedding_response, relevant_results
+    
+    question = question + " " + img_description
+    embedding_response, image_results = await embed_and_search(question)
+    relevant_results = merge_results(relevant_results, image_results, limit=CONTEXT)
+    return question, embedding_response, relevant_results
+
+async def shared_retrieve_context(question: str, image_base64: Optional[str] = None):
+    """retrieve_context, shared by identical questions that are in flight at the same time."""
+    return await app.state.inflight_retrievals.do(request_key(question, image_base64),
+                                                  lambda: retrieve_context(question, image_base64))
+
+async def process_query(question: str, image_base64: Optional[str] = None):
+    """
+    {"answer", "links"} for one /api/ query. Identical questions in flight at the same
+    time share one OCR -> embed -> search -> answer run; its errors reach every waiter.
+    """
+    return await app.state.inflight_answers.do(request_key(question, image_base64),
+                                               lambda: answer_query(question, image_base64))
+
+async def answer_query(question: str, image_base64: Optional[str] = None):
+    try:
+        question, embedding_response, relevant_results = await shared_retrieve_context(question, image_base64)
         
-        # Find relevant content
-        relevant_results = find_similar_content(embedding_response, CONTEXT, discourse_embeddings, markdown_embeddings)
+        # Serve a stored answer when a near-identical question retrieved the same chunks
+        answer_cache = app.state.answer_cache
+        result_key = result_set_key(relevant_results)
+        cached = answer_cache.get(embedding_response, result_key)
+        if cached is not None:
+            return cached
         
         # Generate answer
-        answer = await generate_answer(OPEN_API_KEY, question, relevant_results)
-        llm_response = parse_llm_response(answer)
+        with span("generation"):
+            answer = await generate_answer(OPEN_API_KEY, question, relevant_results, client=app.state.http_client)
+        with span("parsing"):
+            llm_response = parse_llm_response(answer)
+        answer_cache.put(embedding_response, result_key, llm_response)
         
         return llm_response
         
+    except HTTPException:
+        raise
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except binascii.Error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid base64 image: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_query(question: str, image_base64: Optional[str] = None):
+    """
+    Server-Sent Events for one query: "token" events with answer text as it is generated,
+    then a "links" event with the parsed sources and a final "done" (or "error").
+    """
+    try:
+        question, embedding_response, relevant_results = await shared_retrieve_context(question, image_base64)
+        
+        answer_cache = app.state.answer_cache
+        result_key = result_set_key(relevant_results)
+        cached = answer_cache.get(embedding_response, result_key)
+        if cached is not None:
+            yield sse_event("token", {"text": cached["answer"]})
+            yield sse_event("links", cached["links"])
+            yield sse_event("done", {})
+            return
+        
+        parser = StreamingAnswerParser()
+        # Headers are already sent, so these spans only reach /metrics
+        with span("generation"):
+            async for delta in generate_answer_stream(OPEN_API_KEY, question, relevant_results,
+                                                      client=app.state.http_client):
+                text = parser.feed(delta)
+                if text:
+                    yield sse_event("token", {"text": text})
+        with span("parsing"):
+            text, links = parser.finish()
+        if text:
+            yield sse_event("token", {"text": text})
+        yield sse_event("links", links)
+        answer_cache.put(embedding_response, result_key, {"answer": parser.answer, "links": links})
+        yield sse_event("done", {})
+        
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        yield sse_event("error", {"detail": f"Error processing query: {str(e)}"})
+
+# How often a waiting /api/ request checks whether its client is still connected
+DISCONNECT_POLL_INTERVAL = 0.5
+
+class ClientDisconnected(Exception):
+    pass
+
+async def until_disconnect(http_request: Request, awaitable):
+    """
+    Result of awaitable, or ClientDisconnected if the client goes away first. Leaving
+    cancels this request's wait; a shared in-flight pipeline keeps running for other waiters.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        task.cancel()
 
 @app.post("/api/", response_model=QueryResponse)
-async def query_endpoint(request: QueryRequest):
+async def query_endpoint(request: QueryRequest, http_request: Request):
     """
     Main endpoint for processing queries with optional images
     """
     try:
-        result = await process_query(request.question, request.image)
+        result = await until_disconnect(http_request, process_query(request.question, request.image))
         return QueryResponse(**result)
+    except ClientDisconnected:
+        # Nobody is left to read the response; 499 is nginx's "client closed request"
+        raise HTTPException(status_code=499, detail="Client closed request")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+@app.post("/api/stream")
+async def query_stream_endpoint(request: QueryRequest):
+    """
+    Streaming variant of /api/ (Server-Sent Events)
+    """
+    return StreamingResponse(stream_query(request.question, request.image), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def cache_metric_lines():
+    caches = {"embedding": app.state.embedding_cache.stats(), "ocr": app.state.ocr_cache.stats(),
+              "answer": app.state.answer_cache.stats()}
+    lines = []
+    for field, name, help_text, metric_type in [
+        ("hits", "rag_cache_hits_total", "Cache lookups that hit", "counter"),
+        ("misses", "rag_cache_misses_total", "Cache lookups that missed", "counter"),
+        ("hit_rate", "rag_cache_hit_rate", "Fraction of cache lookups that hit", "gauge"),
+        ("entries", "rag_cache_entries", "Cached entries", "gauge"),
+    ]:
+        lines += sample_lines(name, help_text, {(cache,): stats[field] for cache, stats in caches.items()},
+                              ("cache",), metric_type)
+    return lines
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Prometheus text-format metrics: stage and request latency histograms, upstream
+    retries, cache hit rates, index size, image and batching totals
+    """
+    indexes = [discourse_index, markdown_index]
+    batcher = app.state.query_batcher
+    lines = cache_metric_lines()
+    lines += sample_lines("rag_index_rows", "Rows in a search index",
+                          {(index.source,): len(index) for index in indexes}, ("source",))
+    lines += sample_lines("rag_index_bytes", "Embedding matrix (plus first-pass codes) size in bytes",
+                          {(index.source,): index.matrix.nbytes + (index.codes.nbytes if index.codes is not None else 0)
+                          for index in indexes}, ("source",))
+    lines += sample_lines("rag_images_total", "Images prepared for the vision model, by outcome",
+                          {("prepared",): image_stats["images"], ("rejected",): image_stats["rejected"]},
+                          ("outcome",), "counter")
+    lines += sample_lines("rag_image_bytes_total", "Image bytes received and sent to the vision model",
+                          {("original",): image_stats["original_bytes"], ("sent",): image_stats["sent_bytes"]},
+                          ("kind",), "counter")
+    lines += sample_lines("rag_query_batches_total", "Coalesced query embedding batches",
+                          {(): batcher.batches}, metric_type="counter")
+    lines += sample_lines("rag_query_batch_items_total", "Questions sent in coalesced batches",
+                          {(): batcher.items}, metric_type="counter")
+    lines += sample_lines("rag_singleflight_shared_total", "Requests that joined an identical in-flight request",
+                          {("retrieval",): app.state.inflight_retrievals.shared,
+                           ("answer",): app.state.inflight_answers.shared}, ("stage",), "counter")
+    return PlainTextResponse(render(lines), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
     """
@@ -0,0 +1,77 @@
+"""
+Micro-batching for concurrent requests.
+
+Items submitted within `window` seconds of the first pending one (or until `max_batch`
+are pending) are handed to one `process(items)` call, and each caller gets its own entry
+of the returned list. Serving uses it to turn concurrent single-question embedding
+calls into one batched /embeddings request and one matrix-matrix search, so a burst of
+questions costs one request against the upstream rate limit instead of one each.
+"""
+import asyncio
+
+
+class MicroBatcher:
+    def __init__(self, process, window=0.005, max_batch=32):
+        # process: async callable, list of items -> list of results in the same order
+        self.process = process
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []  # (item, future)
+        self._timer = None
+        self._tasks = set()
+        # Batches sent and items in them, for the average batch size on /metrics
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item):
+        """Result for one item; raises whatever the batch it landed in raised."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        # A caller cancelled here (e.g. by a deadline) cancels only its own future
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = [(item, future) for item, future in self._pending if not future.done()]
+        self._pending = []
+        if batch:
+            self.batches += 1
+            self.items += len(batch)
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        try:
+            results = await self.process([item for item, _ in batch])
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            # Batch cancelled (shutdown): don't leave callers waiting forever
+            for _, future in batch:
+                if not future.done():
+                    future.cancel()
+
+    async def close(self):
+        """Cancel the pending timer and any batch still in flight."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for _, future in self._pending:
+            future.cancel()
+        self._pending = []
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
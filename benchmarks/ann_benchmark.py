@@ -0,0 +1,82 @@
+"""
+Recall@k vs. latency of IVF search against exact search, one row per nprobe setting.
+
+Run from the repo root against a real index directory (queries are sampled rows with noise):
+    python -m benchmarks.ann_benchmark --index-dir embeddings/discourse_index
+
+or against a synthetic clustered corpus:
+    python -m benchmarks.ann_benchmark --rows 100000 --dim 1536
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ann import IVFIndex
+from index_store import load_index
+from search import VectorIndex, normalize_query, normalize_rows, search_indexes
+
+
+def synthetic_index(rows, dim, clusters, rng):
+    centers = normalize_rows(rng.standard_normal((clusters, dim), dtype=np.float32))
+    labels = rng.integers(0, clusters, rows)
+    matrix = centers[labels] + 0.6 / np.sqrt(dim) * rng.standard_normal((rows, dim), dtype=np.float32)
+    return VectorIndex(normalize_rows(matrix.astype(np.float32)), [], [], "bench")
+
+
+def top_rows(index, query, k):
+    # threshold -1 so recall measures ranking only, not the 0.5 cut-off
+    return [row for _, row, _ in search_indexes(query, [index], k, threshold=-1.0)]
+
+
+def run(index, queries, k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(top_rows(index, query, k))
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-dir")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    index = load_index(args.index_dir) if args.index_dir else synthetic_index(args.rows, args.dim, args.clusters, rng)
+    matrix = index.matrix
+    dim = matrix.shape[1]
+    sample = rng.choice(len(index), args.queries, replace=len(index) < args.queries)
+    queries = [normalize_query(np.asarray(matrix[i], dtype=np.float32) + 0.3 / np.sqrt(dim) * rng.standard_normal(dim))
+               for i in sample]
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(matrix, args.nlist)
+    print(f"rows={len(index)} dim={dim} nlist={ivf.nlist} build={time.perf_counter() - start:.1f}s")
+
+    exact, exact_ms = run(index, queries, args.k)
+    print(f"{'mode':>12} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p95 ms':>8} {'scanned':>8}")
+    print(f"{'exact':>12} {1.0:>10.3f} {np.percentile(exact_ms, 50):>8.2f} {np.percentile(exact_ms, 95):>8.2f} {1.0:>8.1%}")
+
+    index.ann = ivf
+    for nprobe in args.nprobe:
+        if nprobe > ivf.nlist:
+            continue
+        ivf.nprobe = nprobe
+        approx, approx_ms = run(index, queries, args.k)
+        recall = np.mean([len(set(a) & set(e)) / max(1, len(e)) for a, e in zip(approx, exact)])
+        scanned = np.mean([len(ivf.probe(q)) for q in queries]) / len(index)
+        print(f"{'nprobe=' + str(nprobe):>12} {recall:>10.3f} {np.percentile(approx_ms, 50):>8.2f} "
+              f"{np.percentile(approx_ms, 95):>8.2f} {scanned:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Benchmark: the old three-pass get_chunks vs. the single-pass chunker.iter_chunks.
+
+Run from the repo root:
+    python -m benchmarks.chunk_benchmark --largest 10
+
+Times both chunkers on the largest Markdown pages and Discourse threads under raw-data/
+(extracted the same way main.py / main_discourse.py do, without image descriptions),
+then on synthetic text of doubling size to show how each one scales. Without raw-data/
+only the synthetic part runs.
+"""
+import argparse
+import random
+import re
+import time
+from pathlib import Path
+
+from chunker import iter_chunks
+from config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+
+
+def legacy_get_chunks(text, chunk_overlap: int = 100, max_embedding_chars: int = 8000):
+    """embed.get_chunks as it was before chunker.py, kept here as the baseline."""
+    if not text:
+        return []
+    chunks = []
+    text = re.sub(r'\n+', '\n', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = text.strip()
+    if len(text) <= max_embedding_chars:
+        return [text]
+    paragraphs = text.split('\n')
+    current_chunk = ""
+    for para in paragraphs:
+        if len(para) > max_embedding_chars:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+                current_chunk = ""
+            sentences = re.split(r'(?<=[.!?])\s+', para)
+            sentence_chunk = ""
+            for sentence in sentences:
+                if len(sentence) > max_embedding_chars:
+                    if sentence_chunk:
+                        chunks.append(sentence_chunk.strip())
+                        sentence_chunk = ""
+                    for j in range(0, len(sentence), max_embedding_chars - chunk_overlap):
+                        sentence_part = sentence[j:j + max_embedding_chars]
+                        if sentence_part:
+                            chunks.append(sentence_part.strip())
+                elif len(sentence_chunk) + len(sentence) > max_embedding_chars and sentence_chunk:
+                    chunks.append(sentence_chunk.strip())
+                    sentence_chunk = sentence
+                else:
+                    sentence_chunk = sentence_chunk + " " + sentence if sentence_chunk else sentence
+            if sentence_chunk:
+                chunks.append(sentence_chunk.strip())
+        elif len(current_chunk) + len(para) > max_embedding_chars and current_chunk:
+            chunks.append(current_chunk.strip())
+            current_chunk = para
+        else:
+            current_chunk = current_chunk + " " + para if current_chunk else para
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    if not chunks:
+        return chunks
+    overlapped_chunks = [chunks[0]]
+    for i in range(1, len(chunks)):
+        prev_chunk = chunks[i - 1]
+        current_chunk = chunks[i]
+        if len(prev_chunk) > chunk_overlap:
+            overlap_start = max(0, len(prev_chunk) - chunk_overlap)
+            sentence_break = prev_chunk.rfind('. ', overlap_start)
+            if sentence_break != -1 and sentence_break > overlap_start:
+                overlap = prev_chunk[sentence_break + 2:]
+                if overlap and not current_chunk.startswith(overlap):
+                    proposed_chunk = overlap + " " + current_chunk
+                    if len(proposed_chunk) <= max_embedding_chars:
+                        current_chunk = proposed_chunk
+                    else:
+                        available_space = max_embedding_chars - len(current_chunk) - 1
+                        if available_space > 0:
+                            current_chunk = overlap[:available_space] + " " + current_chunk
+        overlapped_chunks.append(current_chunk)
+    validated_chunks = []
+    for chunk in overlapped_chunks:
+        if len(chunk) <= max_embedding_chars:
+            validated_chunks.append(chunk)
+        else:
+            for j in range(0, len(chunk), max_embedding_chars - chunk_overlap):
+                subchunk = chunk[j:j + max_embedding_chars]
+                if subchunk:
+                    validated_chunks.append(subchunk.strip())
+    return validated_chunks
+
+
+def markdown_texts(directory, largest):
+    from extract_text import extract_text_from_markdown
+    files = sorted(Path(directory).glob("*.md"), key=lambda p: p.stat().st_size, reverse=True)[:largest]
+    return [(f"md:{path.name}", extract_text_from_markdown(path)[0]) for path in files]
+
+
+def discourse_texts(directory, largest):
+    from extract_text import clean_html
+    from helper import read_json_file
+    files = sorted(Path(directory).glob("*.json"), key=lambda p: p.stat().st_size, reverse=True)[:largest]
+    texts = []
+    for path in files:
+        posts = read_json_file(path).get("post_stream", {}).get("posts", [])
+        texts.append((f"discourse:{path.name}", "".join(clean_html(p.get("cooked", "")) + "\n\n" for p in posts)))
+    return texts
+
+
+def synthetic_text(n_chars, rng):
+    words = ("the docker container image fails to build because the python version in the "
+             "requirements file does not match numpy pandas assignment deadline grading").split()
+    paragraphs = []
+    total = 0
+    while total < n_chars:
+        sentences = [" ".join(rng.choice(words) for _ in range(rng.randint(4, 30))).capitalize() + "."
+                     for _ in range(rng.randint(1, 8))]
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def timed(fn, repeats):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def compare(name, text, args):
+    legacy_time, legacy = timed(lambda: legacy_get_chunks(text), args.repeats)
+    new_time, chunks = timed(lambda: list(iter_chunks(text, args.max_tokens, args.overlap_tokens)), args.repeats)
+    longest = max((len(chunk.text) for chunk in chunks), default=0)
+    print(f"{name[:40]:<40} {len(text):>9} {legacy_time * 1000:>10.2f} {new_time * 1000:>10.2f} "
+          f"{len(legacy):>7} {len(chunks):>7} {longest:>8}")
+    return legacy_time, new_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--markdown-dir", default="raw-data/Markdown-data")
+    parser.add_argument("--discourse-dir", default="raw-data/Discourse-data")
+    parser.add_argument("--largest", type=int, default=10, help="files of each kind to chunk")
+    parser.add_argument("--synthetic-sizes", type=int, nargs="+", default=[100_000, 200_000, 400_000, 800_000, 1_600_000])
+    parser.add_argument("--max-tokens", type=int, default=CHUNK_MAX_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=CHUNK_OVERLAP_TOKENS)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = []
+    if Path(args.markdown_dir).is_dir():
+        texts += markdown_texts(args.markdown_dir, args.largest)
+    if Path(args.discourse_dir).is_dir():
+        texts += discourse_texts(args.discourse_dir, args.largest)
+    rng = random.Random(0)
+    texts += [(f"synthetic {n}", synthetic_text(n, rng)) for n in args.synthetic_sizes]
+
+    print(f"{'text':<40} {'chars':>9} {'old (ms)':>10} {'new (ms)':>10} {'old #':>7} {'new #':>7} {'longest':>8}")
+    legacy_total = new_total = 0.0
+    for name, text in texts:
+        legacy_time, new_time = compare(name, text, args)
+        legacy_total += legacy_time
+        new_total += new_time
+    print(f"total: old {legacy_total * 1000:.1f} ms, new {new_total * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Parity check and timing for ingestion text extraction.
+
+Run from the repo root:
+    python -m benchmarks.extract_benchmark --workers 0
+
+Parity: extract_text.clean_html / extract_text_from_markdown (fast path, BeautifulSoup
+fallback) must return exactly what the BeautifulSoup-only versions below return, for
+every Discourse post and Markdown page under raw-data/ plus a set of awkward samples.
+Any mismatch is printed and the script exits non-zero.
+
+Timing: the old serial BeautifulSoup extraction vs. the fast path, serially and through
+extract_files' process pool. Without raw-data/, synthetic topics and pages are written
+to a temporary directory and used instead.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import frontmatter
+from bs4 import BeautifulSoup
+from markdown import markdown
+
+from extract_text import clean_html, extract_discourse_topic, extract_files, extract_text_from_markdown
+from helper import extract_europe1_urls, read_json_file
+
+SAMPLES = [
+    "",
+    "<p>plain</p>",
+    "<p>a<b>b</b>c &amp; d&nbsp;e &lt;tag&gt; &#169; &copy &unknown;</p>",
+    '<p><a href="https://x.org/?a=1&amp;b=2" title="a > b">link</a> after</p>',
+    "<p>line<br>break<br/>and\n\n  spaces\t</p>\n<ul>\n<li>one</li>\n<li>two</li>\n</ul>",
+    '<div class="lightbox-wrapper"><a class="lightbox" href="https://europe1.discourse-cdn.com/x.png">'
+    '<img src="https://europe1.discourse-cdn.com/x.png" alt="image" width="690" height="388"></a></div>',
+    "<p>comment <!-- hidden --> here</p>",
+    "<p>script</p><script>var x = '<p>';</script><style>p { color: red }</style>",
+    "<pre><code class=\"lang-python\">if a &lt; b:\n    print('x')\n</code></pre>",
+    "<p>stray < angle and 3<4</p>",
+    "<p>&apos; &#x27; &#39; &#150; &hellip; &quot;q&quot; &#x1F600; & alone &&amp;</p>",
+    "<aside class=\"quote\"><blockquote><p>quoted</p></blockquote></aside><p>reply</p>",
+]
+
+MARKDOWN_SAMPLES = [
+    "---\noriginal_url: https://tds/x\n---\n# Title\n\nSome *emphasis* and `code <x>`.\n\n- a\n- b\n",
+    "---\noriginal_url: https://tds/y\n---\n[Previous](a.md)\n\nText with <span>inline html</span> & ampersand.\n",
+    "---\noriginal_url: https://tds/z\n---\n<!-- comment -->\n\n    indented code\n\n> quote\n",
+]
+
+
+def soup_clean_html(html_content):
+    """clean_html before the fast path."""
+    if not html_content:
+        return ""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for script_or_style in soup(["script", "style"]):
+        script_or_style.decompose()
+    text = soup.get_text(separator=' ')
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def soup_markdown_text(filepath):
+    """extract_text_from_markdown before the fast path."""
+    post = frontmatter.load(filepath)
+    content = re.sub(r'^\[(Previous|Next)[\s\S]*?\]\([^\)]*\)\s*', '', post.content,
+                     flags=re.MULTILINE | re.IGNORECASE)
+    soup = BeautifulSoup(markdown(content), "html.parser")
+    return soup.get_text(separator='\n').strip(), post.get('original_url', '')
+
+
+def soup_discourse_topic(file_path):
+    data = read_json_file(file_path)
+    posts = []
+    for post in data.get('post_stream', {}).get('posts', []):
+        content = post.get('cooked', '')
+        img_urls = extract_europe1_urls(content)
+        posts.append((soup_clean_html(content), img_urls[0] if img_urls else None))
+    return data.get('id'), data.get('slug', ''), posts
+
+
+def synthetic_post(rng):
+    words = "docker podman assignment deadline grading numpy pandas error build container".split()
+    parts = []
+    for _ in range(rng.randint(1, 6)):
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(5, 25)))
+        kind = rng.random()
+        if kind < 0.2:
+            parts.append(f'<p>{sentence} <a href="https://example.org/{rng.randint(1, 99)}?a=1&amp;b=2">link</a></p>')
+        elif kind < 0.35:
+            parts.append(f"<pre><code class=\"lang-python\">x = a &lt; b  # {sentence}\n</code></pre>")
+        elif kind < 0.45:
+            parts.append(f"<ul>\n<li>{sentence}</li>\n<li><strong>{sentence}</strong></li>\n</ul>")
+        else:
+            parts.append(f"<p>{sentence} &amp; <em>{sentence}</em>&nbsp;<code>x</code></p>")
+    return "\n".join(parts)
+
+
+def write_synthetic(directory, topics, pages, rng):
+    discourse_dir = Path(directory, "Discourse-data")
+    markdown_dir = Path(directory, "Markdown-data")
+    discourse_dir.mkdir()
+    markdown_dir.mkdir()
+    for i in range(topics):
+        posts = [{"cooked": synthetic_post(rng)} for _ in range(rng.randint(2, 30))]
+        with open(discourse_dir / f"topic_{i}.json", "w", encoding="utf-8") as f:
+            json.dump({"id": i, "slug": f"topic-{i}", "post_stream": {"posts": posts}}, f)
+    for i in range(pages):
+        sections = []
+        for j in range(rng.randint(3, 20)):
+            sections.append(f"## Section {j}\n\nSome text with `code` and a [link](https://x.org/{j}).\n\n"
+                            f"- item one\n- item **two**\n\n```\nprint('{j}')\n```\n")
+        with open(markdown_dir / f"page_{i}.md", "w", encoding="utf-8") as f:
+            f.write(f"---\noriginal_url: https://tds/{i}\n---\n# Page {i}\n\n" + "\n".join(sections))
+    return discourse_dir, markdown_dir
+
+
+def check_parity(discourse_files, markdown_files, sample_dir):
+    mismatches = 0
+    checked = 0
+    for html_content in SAMPLES:
+        checked += 1
+        if clean_html(html_content) != soup_clean_html(html_content):
+            mismatches += 1
+            print(f"❌ clean_html mismatch for sample {html_content[:60]!r}")
+    for path in discourse_files:
+        for post in read_json_file(path).get('post_stream', {}).get('posts', []):
+            checked += 1
+            content = post.get('cooked', '')
+            if clean_html(content) != soup_clean_html(content):
+                mismatches += 1
+                print(f"❌ clean_html mismatch in {path.name}: {content[:60]!r}")
+
+    sample_files = []
+    for i, text in enumerate(MARKDOWN_SAMPLES):
+        path = Path(sample_dir, f"sample_{i}.md")
+        path.write_text(text, encoding="utf-8")
+        sample_files.append(path)
+    for path in [*sample_files, *markdown_files]:
+        checked += 1
+        if extract_text_from_markdown(path) != soup_markdown_text(path):
+            mismatches += 1
+            print(f"❌ extract_text_from_markdown mismatch for {path.name}")
+    print(f"Parity: {checked - mismatches}/{checked} identical")
+    return mismatches
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--markdown-dir", default="raw-data/Markdown-data")
+    parser.add_argument("--discourse-dir", default="raw-data/Discourse-data")
+    parser.add_argument("--workers", type=int, default=0, help="process pool size, 0 = one per CPU")
+    parser.add_argument("--synthetic-topics", type=int, default=400)
+    parser.add_argument("--synthetic-pages", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        discourse_dir, markdown_dir = Path(args.discourse_dir), Path(args.markdown_dir)
+        if not (discourse_dir.is_dir() and markdown_dir.is_dir()):
+            print(f"raw-data not found, using {args.synthetic_topics} synthetic topics "
+                  f"and {args.synthetic_pages} pages")
+            discourse_dir, markdown_dir = write_synthetic(tmp, args.synthetic_topics, args.synthetic_pages,
+                                                          random.Random(0))
+        discourse_files = sorted(discourse_dir.glob("*.json"))
+        markdown_files = sorted(markdown_dir.glob("*.md"))
+
+        mismatches = check_parity(discourse_files, markdown_files, tmp)
+
+        print(f"{'stage':<12} {'files':>6} {'bs4 serial (s)':>15} {'fast serial (s)':>16} {'fast pool (s)':>14}")
+        for name, files, old, new in [
+            ("discourse", discourse_files, soup_discourse_topic, extract_discourse_topic),
+            ("markdown", markdown_files, soup_markdown_text, extract_text_from_markdown),
+        ]:
+            old_time = timed(lambda: [old(path) for path in files])
+            serial_time = timed(lambda: extract_files(new, files, workers=1))
+            pool_time = timed(lambda: extract_files(new, files, workers=args.workers))
+            print(f"{name:<12} {len(files):>6} {old_time:>15.2f} {serial_time:>16.2f} {pool_time:>14.2f}")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
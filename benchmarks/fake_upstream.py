@@ -0,0 +1,190 @@
+"""
+Local stand-in for the OpenAI-compatible upstream (aipipe.org) used by the benchmarks.
+
+Serves POST /openai/v1/embeddings and /openai/v1/chat/completions (plain, streamed and
+vision requests) with configurable latency, jitter and injected 429 responses, so the
+app and the ingestion scripts can be measured without network access or API cost.
+Embeddings are deterministic per input text; GET /stats returns request counts.
+
+Point the code under test at it with AIPIPE_BASE_URL:
+    python -m benchmarks.fake_upstream --port 8900 --embed-latency-ms 40 --rate-limit 0.02
+    AIPIPE_BASE_URL=http://127.0.0.1:8900/openai/v1 OPEN_API_KEY=bench uvicorn app:app
+
+load_benchmark and ingest_benchmark start it themselves (start_fake_upstream).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import httpx
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER = ("Use the tool the course recommends and check the linked post for details.\n\n"
+          "Sources:\n1. URL: [https://discourse.onlinedegree.iitm.ac.in/t/example/1], Text: [example]")
+IMAGE_DESCRIPTION = "A screenshot of a terminal showing an error message."
+
+
+def fake_embedding(text, dim):
+    """Unit vector seeded by the text, so identical inputs always embed identically."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(embed_latency=0.04, chat_latency=0.8, vision_latency=1.2, jitter=0.2, rate_limit=0.0,
+               dim=1536, stream_chunks=20, seed=0):
+    """Latencies in seconds; jitter is the +/- fraction of each latency; rate_limit the 429 probability."""
+    app = FastAPI(title="fake upstream")
+    rng = random.Random(seed)
+    stats = {"requests": {}, "rate_limited": {}, "inputs": 0}
+
+    async def delay(latency):
+        await asyncio.sleep(max(0.0, latency * (1 + rng.uniform(-jitter, jitter))))
+
+    def admit(name):
+        stats["requests"][name] = stats["requests"].get(name, 0) + 1
+        if rng.random() < rate_limit:
+            stats["rate_limited"][name] = stats["rate_limited"].get(name, 0) + 1
+            return JSONResponse({"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+                                status_code=429, headers={"Retry-After": "1"})
+        return None
+
+    @app.post("/openai/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        rejected = admit("embeddings")
+        if rejected is not None:
+            return rejected
+        stats["inputs"] += len(inputs)
+        await delay(embed_latency)
+        data = [{"object": "embedding", "index": i, "embedding": fake_embedding(text, dim).tolist()}
+                for i, text in enumerate(inputs)]
+        return {"object": "list", "data": data, "model": body.get("model")}
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        content = body["messages"][-1]["content"]
+        vision = isinstance(content, list) and any(part.get("type") == "image_url" for part in content)
+        name = "vision" if vision else "chat"
+        rejected = admit(name)
+        if rejected is not None:
+            return rejected
+        text = IMAGE_DESCRIPTION if vision else ANSWER
+        if not body.get("stream"):
+            await delay(vision_latency if vision else chat_latency)
+            return {"choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                 "finish_reason": "stop"}]}
+
+        async def events():
+            # Time to first token is a third of the latency, the rest is spread over the chunks
+            await delay(chat_latency / 3)
+            size = max(1, len(text) // stream_chunks)
+            for start in range(0, len(text), size):
+                delta = {"choices": [{"index": 0, "delta": {"content": text[start:start + size]}}]}
+                yield f"data: {json.dumps(delta)}\n\n"
+                await delay(chat_latency * 2 / 3 / stream_chunks)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise TimeoutError(f"{url} not up after {timeout:.0f}s")
+
+
+def add_upstream_arguments(parser):
+    group = parser.add_argument_group("fake upstream")
+    group.add_argument("--embed-latency-ms", type=float, default=40.0)
+    group.add_argument("--chat-latency-ms", type=float, default=800.0)
+    group.add_argument("--vision-latency-ms", type=float, default=1200.0)
+    group.add_argument("--jitter", type=float, default=0.2, help="+/- fraction of each latency")
+    group.add_argument("--rate-limit", type=float, default=0.0, help="probability of answering 429")
+    group.add_argument("--dim", type=int, default=1536)
+
+
+def upstream_arguments(args):
+    """Command-line flags for the fake upstream process from parsed add_upstream_arguments args."""
+    return ["--embed-latency-ms", str(args.embed_latency_ms), "--chat-latency-ms", str(args.chat_latency_ms),
+            "--vision-latency-ms", str(args.vision_latency_ms), "--jitter", str(args.jitter),
+            "--rate-limit", str(args.rate_limit), "--dim", str(args.dim)]
+
+
+@contextmanager
+def start_fake_upstream(arguments=(), port=None):
+    """Run the fake upstream in a subprocess; yields its AIPIPE_BASE_URL-style base URL."""
+    port = port or free_port()
+    process = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_upstream", "--port", str(port), *arguments],
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(f"http://127.0.0.1:{port}/stats", process)
+        yield f"http://127.0.0.1:{port}/openai/v1"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def upstream_stats(base_url):
+    return httpx.get(base_url.rsplit("/openai/v1", 1)[0] + "/stats").json()
+
+
+def latency_summary(seconds):
+    """p50/p95/p99/mean/max in milliseconds."""
+    if not len(seconds):
+        return {"count": 0}
+    ms = np.asarray(seconds) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"count": len(ms), "p50": round(float(p50), 2), "p95": round(float(p95), 2),
+            "p99": round(float(p99), 2), "mean": round(float(ms.mean()), 2), "max": round(float(ms.max()), 2)}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--seed", type=int, default=0)
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+
+    app = create_app(args.embed_latency_ms / 1000, args.chat_latency_ms / 1000, args.vision_latency_ms / 1000,
+                     args.jitter, args.rate_limit, args.dim, seed=args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Cold-start import profile of the serving app, with a budget check.
+
+Run from the repo root:
+    python -m benchmarks.import_benchmark --budget-ms 1000 --output import.json
+
+`import app` is run --repeats times in fresh interpreters under `python -X importtime`.
+The median total and the slowest top-level imports (cumulative) and modules (self
+time) are printed. Indexes are loaded by the lifespan handler, not at import, so this is
+what a cold start pays before the first request can be routed.
+
+Exits non-zero if the median exceeds --budget-ms or if any module in FORBIDDEN
+(ingestion-only or unused dependencies) gets imported by `import app`, so it can
+run as a regression check in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+# Only ingestion needs these (or nothing does); serving must not pay for them
+FORBIDDEN = ("google.genai", "requests", "bs4", "markdown", "frontmatter", "PIL")
+
+
+def profile_import(module):
+    """[(depth, name, self_us, cumulative_us)] for one cold `import module`."""
+    env = {**os.environ, "OPEN_API_KEY": os.environ.get("OPEN_API_KEY", "bench")}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-4000:]}")
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # "import time:   self | cumulative | <2 spaces per nesting level>name"
+        head, cumulative_us, name = line.split("|")
+        self_us = int(head.split(":", 1)[1])
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((depth, name.strip(), self_us, int(cumulative_us)))
+    return entries
+
+
+def loaded_modules(module):
+    code = f"import json, sys, {module}; print(json.dumps(sorted(sys.modules)))"
+    env = {**os.environ, "OPEN_API_KEY": os.environ.get("OPEN_API_KEY", "bench")}
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+                            check=True)
+    return set(json.loads(result.stdout.strip().splitlines()[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000.0)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="write the JSON report here (default: stdout only)")
+    args = parser.parse_args()
+
+    runs = [profile_import(args.module) for _ in range(args.repeats)]
+    totals_ms = [next(cum for depth, name, _, cum in run if depth == 0 and name == args.module) / 1000
+                 for run in runs]
+    median_ms = statistics.median(totals_ms)
+    # Profile of the median run
+    profile = runs[totals_ms.index(sorted(totals_ms)[len(totals_ms) // 2])]
+
+    top_level = sorted(((name, cum / 1000) for depth, name, _, cum in profile if depth <= 1),
+                       key=lambda item: -item[1])[:args.top]
+    by_self = sorted(((name, self_us / 1000) for _, name, self_us, _ in profile), key=lambda item: -item[1])[:args.top]
+    modules = loaded_modules(args.module)
+    forbidden = sorted(name for name in FORBIDDEN if name in modules)
+
+    print(f"import {args.module}: median {median_ms:.1f} ms over {args.repeats} runs "
+          f"(min {min(totals_ms):.1f}, max {max(totals_ms):.1f}), budget {args.budget_ms:.0f} ms", file=sys.stderr)
+    print(f"{'slowest imports (cumulative)':<40} {'ms':>8}", file=sys.stderr)
+    for name, ms in top_level:
+        print(f"  {name:<38} {ms:>8.1f}", file=sys.stderr)
+    print(f"{'slowest modules (self)':<40} {'ms':>8}", file=sys.stderr)
+    for name, ms in by_self:
+        print(f"  {name:<38} {ms:>8.1f}", file=sys.stderr)
+
+    failures = []
+    if median_ms > args.budget_ms:
+        failures.append(f"median import time {median_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    if forbidden:
+        failures.append(f"serving imports pulled in {', '.join(forbidden)}")
+
+    report = {
+        "benchmark": "import",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "module": args.module,
+        "budget_ms": args.budget_ms,
+        "median_ms": round(median_ms, 1),
+        "runs_ms": [round(ms, 1) for ms in totals_ms],
+        "modules_loaded": len(modules),
+        "forbidden_loaded": forbidden,
+        "top_cumulative_ms": {name: round(ms, 1) for name, ms in top_level},
+        "top_self_ms": {name: round(ms, 1) for name, ms in by_self},
+        "failures": failures,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Ingestion throughput of main.py (Markdown pages) and main_discourse.py (Discourse topics)
+against the local fake upstream (benchmarks/fake_upstream.py).
+
+Run from the repo root:
+    python -m benchmarks.ingest_benchmark --topics 400 --pages 100 --output ingest.json
+
+Synthetic raw-data/ (extract_benchmark.write_synthetic) is written to a temporary working
+directory and both scripts run there as subprocesses, each twice: a full build and an
+unchanged re-run, which the manifest should turn into a no-op. --raw-data copies a real
+raw-data/ directory instead. The JSON report has wall time, files/s, chunks/s and the
+upstream embedding requests (and injected 429s) for every run.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.extract_benchmark import write_synthetic
+from benchmarks.fake_upstream import add_upstream_arguments, start_fake_upstream, upstream_arguments, upstream_stats
+from benchmarks.load_benchmark import REPO_ROOT, stats_delta
+
+SCRIPTS = [
+    ("markdown", "main.py", "Markdown-data", "*.md"),
+    ("discourse", "main_discourse.py", "Discourse-data", "*.json"),
+]
+
+
+def index_rows(index_dir):
+    meta_path = Path(index_dir, "meta.json")
+    if not meta_path.is_file():
+        return 0
+    from index_store import load_index
+    return len(load_index(str(index_dir)))
+
+
+def run_script(script, workdir, env, upstream):
+    before = upstream_stats(upstream)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, str(REPO_ROOT / script)], cwd=workdir, env=env,
+                            capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        print(result.stdout[-4000:], result.stderr[-4000:], sep="\n", file=sys.stderr)
+        raise RuntimeError(f"{script} exited with code {result.returncode}")
+    return wall, stats_delta(before, upstream_stats(upstream))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topics", type=int, default=400, help="synthetic Discourse topics")
+    parser.add_argument("--pages", type=int, default=100, help="synthetic Markdown pages")
+    parser.add_argument("--raw-data", help="copy this raw-data/ directory instead of synthetic data")
+    parser.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE",
+                        help="extra settings, e.g. INGEST_CONCURRENCY=16 EXTRACT_WORKERS=4")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout only)")
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir, start_fake_upstream(upstream_arguments(args)) as upstream:
+        raw_data = Path(workdir, "raw-data")
+        if args.raw_data:
+            shutil.copytree(args.raw_data, raw_data)
+        else:
+            raw_data.mkdir()
+            write_synthetic(raw_data, args.topics, args.pages, random.Random(0))
+        Path(workdir, "embeddings").mkdir()
+
+        env = {**os.environ, "PYTHONPATH": str(REPO_ROOT), "AIPIPE_BASE_URL": upstream, "OPEN_API_KEY": "bench",
+               "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings", "embedding_cache.sqlite"),
+               "OCR_CACHE_PATH": os.path.join(workdir, "embeddings", "ocr_cache.sqlite"),
+               **dict(item.split("=", 1) for item in args.env)}
+        for source, script, data_dir, pattern in SCRIPTS:
+            files = len(list(Path(raw_data, data_dir).glob(pattern)))
+            for run in ("full", "unchanged"):
+                wall, upstream_delta = run_script(script, workdir, env, upstream)
+                rows = index_rows(Path(workdir, "embeddings", f"{source}_index"))
+                runs.append({
+                    "source": source,
+                    "script": script,
+                    "run": run,
+                    "files": files,
+                    "rows": rows,
+                    "wall_s": round(wall, 3),
+                    "files_per_s": round(files / wall, 2),
+                    "rows_per_s": round(rows / wall, 2),
+                    "upstream": upstream_delta,
+                })
+                print(f"{script:<18} {run:<9} {files:>6} files {rows:>7} rows {wall:>8.2f} s "
+                      f"{upstream_delta['requests'].get('embeddings', 0):>5} embedding requests", file=sys.stderr)
+
+    report = {
+        "benchmark": "ingest",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "runs": runs,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
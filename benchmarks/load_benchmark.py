@@ -0,0 +1,200 @@
+"""
+Load test of the /api/ endpoint against the local fake upstream (benchmarks/fake_upstream.py).
+
+Run from the repo root:
+    python -m benchmarks.load_benchmark --concurrency 1 8 32 --requests 200 --output load.json
+
+The app runs as a uvicorn subprocess in a temporary working directory with fresh caches
+and AIPIPE_BASE_URL pointing at the fake upstream. Unless --repo-index is given it
+searches synthetic discourse/markdown indexes of --rows rows each. Questions (and
+file:// images that exist) come from test.yaml. Each request gets a unique suffix so
+the full OCR -> embed -> search -> answer pipeline runs every time; --repeat-questions
+sends them verbatim to measure the caches and single-flight instead. Extra app settings
+can be passed as --app-env QUANTIZATION=int8 RETRIEVAL_MODE=hybrid.
+
+For each concurrency level the JSON report has end-to-end p50/p95/p99 latency and
+throughput, per-stage latencies from the app's Server-Timing header, and the number of
+upstream requests (and injected 429s) by endpoint.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import yaml
+
+from benchmarks.fake_upstream import (add_upstream_arguments, fake_embedding, free_port, latency_summary,
+                                      start_fake_upstream, upstream_arguments, upstream_stats, wait_until_up)
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+WORDS = ("docker podman assignment deadline grading numpy pandas error build container dashboard bonus "
+         "exam project submission model token proxy score week").split()
+
+
+def load_questions(path):
+    """[(question, base64 image or None)] from the promptfoo tests in test.yaml."""
+    config = yaml.safe_load(Path(path).read_text(encoding="utf-8"))
+    questions = []
+    for test in config.get("tests", []):
+        variables = test.get("vars", {})
+        if not variables.get("question"):
+            continue
+        image = None
+        image_ref = variables.get("image")
+        if image_ref and image_ref.startswith("file://"):
+            image_path = Path(path).parent / image_ref[len("file://"):]
+            if image_path.is_file():
+                image = base64.b64encode(image_path.read_bytes()).decode("ascii")
+        questions.append((variables["question"], image))
+    return questions
+
+
+def write_synthetic_indexes(workdir, rows, dim, rng):
+    from index_store import save_index
+    from lexical import build_bm25
+
+    for source in ("discourse", "markdown"):
+        chunks = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(50, 300))) for _ in range(rows)]
+        urls = [f"https://{source}.example/{i // 4}" for i in range(rows)]
+        embeddings = [fake_embedding(chunk, dim) for chunk in chunks]
+        index_dir = os.path.join(workdir, "embeddings", f"{source}_index")
+        save_index(index_dir, chunks, embeddings, urls, source)
+        build_bm25(index_dir)
+
+
+def parse_server_timing(header):
+    """{metric: seconds} from a Server-Timing header value."""
+    timings = {}
+    for metric in filter(None, (part.strip() for part in (header or "").split(","))):
+        name, *params = (param.strip() for param in metric.split(";"))
+        for param in params:
+            if param.startswith("dur="):
+                timings[name] = float(param[4:]) / 1000
+    return timings
+
+
+async def run_level(base_url, questions, concurrency, requests, repeat_questions):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, stages, statuses = [], {}, {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300.0) as client:
+        async def one(i):
+            question, image = questions[i % len(questions)]
+            if not repeat_questions:
+                question = f"{question} (request {concurrency}-{i})"
+            payload = {"question": question, **({"image": image} if image else {})}
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/api/", json=payload)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    response, status = None, type(e).__name__
+                elapsed = time.perf_counter() - start
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+                for name, seconds in parse_server_timing(response.headers.get("server-timing")).items():
+                    stages.setdefault(name, []).append(seconds)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "latency_ms": latency_summary(latencies),
+        "stages_ms": {name: latency_summary(values) for name, values in sorted(stages.items())},
+    }
+
+
+def stats_delta(before, after):
+    delta = {}
+    for key in ("requests", "rate_limited"):
+        delta[key] = {name: count - before[key].get(name, 0) for name, count in after[key].items()
+                      if count - before[key].get(name, 0)}
+    delta["embedded_inputs"] = after["inputs"] - before["inputs"]
+    return delta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--questions", default=str(REPO_ROOT / "test.yaml"))
+    parser.add_argument("--repeat-questions", action="store_true")
+    parser.add_argument("--rows", type=int, default=5000, help="rows per synthetic index")
+    parser.add_argument("--repo-index", action="store_true", help="search the repo's embeddings/ instead")
+    parser.add_argument("--app-env", nargs="*", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout only)")
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    if not questions:
+        sys.exit(f"No questions found in {args.questions}")
+
+    with tempfile.TemporaryDirectory() as workdir, start_fake_upstream(upstream_arguments(args)) as upstream:
+        if args.repo_index:
+            os.symlink(REPO_ROOT / "embeddings", os.path.join(workdir, "embeddings"))
+        else:
+            write_synthetic_indexes(workdir, args.rows, args.dim, random.Random(0))
+
+        port = free_port()
+        env = {**os.environ, "PYTHONPATH": str(REPO_ROOT), "AIPIPE_BASE_URL": upstream, "OPEN_API_KEY": "bench",
+               # keep the repo's caches out of the measurement
+               "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite"),
+               "OCR_CACHE_PATH": os.path.join(workdir, "ocr_cache.sqlite"),
+               **dict(item.split("=", 1) for item in args.app_env)}
+        log_path = os.path.join(workdir, "app.log")
+        with open(log_path, "w") as log:
+            app = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port),
+                                    "--log-level", "warning"], cwd=workdir, env=env, stdout=log, stderr=log)
+        try:
+            wait_until_up(f"http://127.0.0.1:{port}/health", app, timeout=300.0)
+            levels = []
+            for concurrency in args.concurrency:
+                before = upstream_stats(upstream)
+                level = asyncio.run(run_level(f"http://127.0.0.1:{port}", questions, concurrency, args.requests,
+                                              args.repeat_questions))
+                level["upstream"] = stats_delta(before, upstream_stats(upstream))
+                levels.append(level)
+                latency = level["latency_ms"]
+                print(f"concurrency {concurrency:>4}: {level['throughput_rps']:>7.2f} req/s, "
+                      f"p50 {latency.get('p50', 0):>8.1f} ms, p95 {latency.get('p95', 0):>8.1f} ms, "
+                      f"p99 {latency.get('p99', 0):>8.1f} ms, statuses {level['statuses']}", file=sys.stderr)
+        except Exception:
+            print(Path(log_path).read_text()[-4000:], file=sys.stderr)
+            raise
+        finally:
+            app.terminate()
+            app.wait()
+
+    report = {
+        "benchmark": "load",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "questions": len(questions),
+        "levels": levels,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
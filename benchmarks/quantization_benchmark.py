@@ -0,0 +1,100 @@
+"""
+Memory / recall@k / latency of the quantized first pass (quantize.py) against exact search.
+
+Run from the repo root against a real index directory (queries are sampled rows with noise):
+    python -m benchmarks.quantization_benchmark --index-dir embeddings/discourse_index
+
+or against a synthetic clustered corpus:
+    python -m benchmarks.quantization_benchmark --rows 100000 --dim 1536 --shortlist 100 200 400
+
+"resident" is the memory that has to stay loaded for the first pass: the float32 matrix
+for "none", the codes otherwise (the full-precision rows are only read for the shortlist).
+
+Random vectors have no Matryoshka structure, so for the prefix modes the synthetic corpus
+concentrates variance in the leading dimensions (--decay, the e-folding dimension);
+use --index-dir for real text-embedding-3 numbers.
+"""
+import argparse
+import time
+from functools import partial
+
+import numpy as np
+
+from index_store import load_index
+from quantize import QUANTIZATIONS, BinaryCodes, Float16Codes, Int8Codes, PrefixCodes
+from search import VectorIndex, normalize_query, normalize_rows, search_indexes
+
+CODES = {
+    "float16": Float16Codes.from_matrix,
+    "int8": Int8Codes.from_matrix,
+    "binary": BinaryCodes.from_matrix,
+    "prefix256": partial(PrefixCodes.from_matrix, dims=256),
+    "prefix512": partial(PrefixCodes.from_matrix, dims=512),
+}
+
+
+def synthetic_index(rows, dim, clusters, decay, rng):
+    centers = normalize_rows(rng.standard_normal((clusters, dim), dtype=np.float32))
+    labels = rng.integers(0, clusters, rows)
+    matrix = centers[labels] + 0.6 / np.sqrt(dim) * rng.standard_normal((rows, dim), dtype=np.float32)
+    if decay:
+        matrix *= np.exp(-np.arange(dim) / decay).astype(np.float32)
+    return VectorIndex(normalize_rows(matrix.astype(np.float32)), [], [], "bench")
+
+
+def run(index, queries, k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        # threshold -1 so recall measures ranking only, not the 0.5 cut-off
+        results.append([row for _, row, _ in search_indexes(query, [index], k, threshold=-1.0)])
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-dir")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--decay", type=float, default=400.0, help="synthetic only; 0 = isotropic")
+    parser.add_argument("--modes", nargs="+", default=list(QUANTIZATIONS[1:]), choices=QUANTIZATIONS[1:])
+    parser.add_argument("--shortlist", type=int, nargs="+", default=[100, 200, 400])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.index_dir:
+        index = load_index(args.index_dir)
+    else:
+        index = synthetic_index(args.rows, args.dim, args.clusters, args.decay, rng)
+    matrix = index.matrix
+    dim = matrix.shape[1]
+    sample = rng.choice(len(index), args.queries, replace=len(index) < args.queries)
+    queries = [normalize_query(np.asarray(matrix[i], dtype=np.float32) + 0.3 / np.sqrt(dim) * rng.standard_normal(dim))
+               for i in sample]
+
+    exact, exact_ms = run(index, queries, args.k)
+    float32_bytes = len(index) * dim * 4
+    print(f"{len(index)} rows x {dim} dims, {len(queries)} queries, k={args.k}")
+    print(f"{'mode':>9} {'shortlist':>9} {'resident MB':>12} {'bytes/row':>10} {'recall':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8}")
+    print(f"{'none':>9} {'-':>9} {float32_bytes / 2**20:>12.1f} {dim * 4:>10} {1.0:>7.3f} "
+          f"{np.percentile(exact_ms, 50):>8.2f} {np.percentile(exact_ms, 95):>8.2f}")
+
+    for mode in args.modes:
+        codes = CODES[mode](matrix)
+        quantized = VectorIndex(matrix, index.chunks, index.urls, index.source)
+        quantized.codes = codes
+        for shortlist in args.shortlist:
+            quantized.shortlist = shortlist
+            results, ms = run(quantized, queries, args.k)
+            recall = np.mean([len(set(a) & set(b)) / max(1, len(b)) for a, b in zip(results, exact)])
+            print(f"{mode:>9} {shortlist:>9} {codes.nbytes / 2**20:>12.1f} {codes.nbytes // len(index):>10} "
+                  f"{recall:>7.3f} {np.percentile(ms, 50):>8.2f} {np.percentile(ms, 95):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark: legacy per-row cosine_similarity loop vs. the vectorized VectorIndex search,
+one query at a time and --batch queries per matrix-matrix product (search_indexes_batch).
+
+Run from the repo root:
+    python -m benchmarks.search_benchmark --sizes 10000 100000 1000000 --dim 1536
+
+A 1M x 1536 float32 matrix needs ~6 GB of RAM; pass a smaller --dim on small machines.
+The legacy loop is timed on at most --legacy-rows rows and extrapolated linearly above that.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from helper import cosine_similarity
+from search import VectorIndex, normalize_rows, search_indexes, search_indexes_batch
+
+
+def make_index(n, dim, rng):
+    matrix = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 50000):
+        stop = min(n, start + 50000)
+        matrix[start:stop] = rng.standard_normal((stop - start, dim), dtype=np.float32)
+    return VectorIndex(normalize_rows(matrix), [], [], "bench")
+
+
+def time_legacy(index, query, k, threshold, rows):
+    embeddings = index.matrix[:rows, None, :]  # legacy layout: [[embedding]]
+    start = time.perf_counter()
+    results = []
+    for i, embedding in enumerate(embeddings):
+        similarity = cosine_similarity(query, embedding)
+        if similarity >= threshold:
+            results.append((i, similarity))
+    results.sort(key=lambda x: x[1], reverse=True)
+    results[:k]
+    return time.perf_counter() - start
+
+
+def time_vectorized(index, query, k, threshold, repeats):
+    search_indexes(query, [index], k, threshold)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        search_indexes(query, [index], k, threshold)
+    return (time.perf_counter() - start) / repeats
+
+
+def time_batched(index, queries, k, threshold, repeats):
+    """Seconds per query when the whole batch is searched at once."""
+    search_indexes_batch(queries, [index], k, threshold)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        search_indexes_batch(queries, [index], k, threshold)
+    return (time.perf_counter() - start) / repeats / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--legacy-rows", type=int, default=20_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=32, help="queries per batched search")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>10} {'legacy (s)':>12} {'vectorized (ms)':>16} {'speedup':>9} {'batched (ms/query)':>19}")
+    for n in args.sizes:
+        index = make_index(n, args.dim, rng)
+        # A query close to one row so the 0.5 threshold actually selects something
+        query = index.matrix[n // 2] + 0.05 * rng.standard_normal(args.dim, dtype=np.float32)
+
+        rows = min(n, args.legacy_rows)
+        legacy = time_legacy(index, query, args.k, args.threshold, rows) * n / rows
+        vectorized = time_vectorized(index, query, args.k, args.threshold, args.repeats)
+        queries = [index.matrix[i] + 0.05 * rng.standard_normal(args.dim, dtype=np.float32)
+                   for i in rng.integers(0, n, args.batch)]
+        batched = time_batched(index, queries, args.k, args.threshold, args.repeats)
+        note = "*" if rows < n else " "
+        print(f"{n:>10} {legacy:>11.3f}{note} {vectorized * 1000:>16.2f} {legacy / vectorized:>8.0f}x "
+              f"{batched * 1000:>19.3f}")
+        del index
+    print("* legacy time extrapolated from the first --legacy-rows rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Persistent caches shared by ingestion and serving.
+
+SQLiteCache is a size-bounded key -> bytes store: least recently used rows are evicted
+once it grows past max_entries, and hot keys are also kept in an in-process LRU. It is
+best effort: a store that is locked or unwritable turns lookups into misses and writes
+into no-ops instead of raising. Serving calls it through asyncio.to_thread.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Pending last_used updates are written once this many keys have been read (or with the next insert)
+TOUCH_BATCH = 256
+
+
+def _connect(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False)
+    try:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        db.commit()
+    except sqlite3.Error:
+        db.close()
+        raise
+    return db
+
+
+class SQLiteCache:
+    def __init__(self, path, max_entries=200_000, memory_entries=1024, timeout=5.0):
+        self.path = path
+        try:
+            self.db = _connect(path)
+            self.persistent = True
+        except (OSError, sqlite3.Error) as e:
+            # Read-only deployments (e.g. Vercel, where only /tmp is writable) still serve,
+            # with a cache that lives as long as the process
+            print(f"⚠️ Cache {path} unavailable ({e}), keeping it in memory only")
+            self.db = _connect(":memory:")
+            self.persistent = False
+        # How long a lookup or write waits for another process's write lock (e.g. a running
+        # ingestion) before it gives up and counts as a miss / is skipped
+        self.db.execute(f"PRAGMA busy_timeout = {int(timeout * 1000)}")
+        # Serving calls the cache from worker threads; one connection, one caller at a time
+        self.lock = threading.RLock()
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        # key -> last_used not yet written; recency only orders eviction, so it is written in batches
+        self.touched = {}
+        self.size = self._count()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self):
+        return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _write_touched(self):
+        """Queue the pending last_used updates in the current transaction (the caller commits)."""
+        touched, self.touched = self.touched, {}
+        if touched:
+            self.db.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                [(last_used, key) for key, last_used in touched.items()])
+
+    def get_many(self, keys):
+        """
+        Return {key: value} for the keys that are cached. Keys the store can't be read
+        for right now (locked, I/O error) are misses.
+        """
+        with self.lock:
+            found = {}
+            missing = []
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+                else:
+                    missing.append(key)
+
+            try:
+                # SQLite caps the number of bound parameters, so look up in slices
+                for start in range(0, len(missing), 500):
+                    part = missing[start:start + 500]
+                    placeholders = ",".join("?" * len(part))
+                    rows = self.db.execute(f"SELECT key, value FROM entries WHERE key IN ({placeholders})",
+                                           part).fetchall()
+                    for key, value in rows:
+                        found[key] = value
+                        self._remember(key, value)
+            except sqlite3.Error as e:
+                print(f"⚠️ Cache {self.path} lookup failed: {e}")
+
+            now = time.time()
+            self.touched.update((key, now) for key in found)
+            if len(self.touched) >= TOUCH_BATCH:
+                try:
+                    self._write_touched()
+                    self.db.commit()
+                except sqlite3.Error:
+                    # Only eviction order is lost
+                    self.db.rollback()
+
+            hits = sum(key in found for key in keys)
+            self.hits += hits
+            self.misses += len(keys) - hits
+            return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items):
+        """Store (key, value) pairs. Best effort: a store that can't be written right now is skipped."""
+        with self.lock:
+            for key, value in items:
+                self._remember(key, value)
+            now = time.time()
+            try:
+                self._write_touched()
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO entries (key, value, last_used) VALUES (?, ?, ?)",
+                    [(key, value, now) for key, value in items],
+                )
+                self.db.commit()
+                self.size += len(items)
+                if self.size > self.max_entries:
+                    self.evict()
+            except sqlite3.Error as e:
+                self.db.rollback()
+                print(f"⚠️ Cache {self.path} write failed: {e}")
+
+    def set(self, key, value):
+        self.set_many([(key, value)])
+
+    def evict(self):
+        """Drop least recently used rows down to 90% of max_entries, so eviction isn't run on every insert."""
+        with self.lock:
+            self._write_touched()
+            excess = self._count() - int(self.max_entries * 0.9)
+            if excess > 0:
+                self.db.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_used LIMIT ?)", (excess,)
+                )
+                self.memory.clear()
+            self.db.commit()
+            self.size = self._count()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self.size,
+            "persistent": self.persistent,
+        }
+
+    def close(self):
+        with self.lock:
+            try:
+                self._write_touched()
+                self.db.commit()
+            except sqlite3.Error:
+                pass
+            self.db.close()
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def embedding_key(model, text):
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(SQLiteCache):
+    """Embeddings keyed by hash(model, whitespace-normalized text), stored as float32 bytes."""
+
+    def get_embeddings(self, texts, model):
+        """Return {position: embedding} for the texts that are cached."""
+        keys = [embedding_key(model, text) for text in texts]
+        found = self.get_many(keys)
+        return {
+            i: np.frombuffer(found[key], dtype=np.float32).tolist()
+            for i, key in enumerate(keys) if key in found
+        }
+
+    def set_embeddings(self, texts, embeddings, model):
+        self.set_many([
+            (embedding_key(model, text), np.asarray(embedding, dtype=np.float32).tobytes())
+            for text, embedding in zip(texts, embeddings)
+        ])
+
+
+def image_key(image_bytes):
+    return "img:" + hashlib.sha256(image_bytes).hexdigest()
+
+
+def url_key(url):
+    return "url:" + url
+
+
+class OCRCache(SQLiteCache):
+    """
+    Image descriptions keyed by hash of the decoded image bytes, with the image URL as a
+    secondary key so a linked image that was seen before doesn't even need fetching.
+    """
+
+    def get_description(self, key):
+        """Description stored for image_key(image bytes), or None."""
+        return self._lookup(key)
+
+    def get_by_url(self, url):
+        return self._lookup(url_key(url))
+
+    def _lookup(self, key):
+        value = self.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set_description(self, description, key=None, url=None):
+        """Store description under image_key(image bytes) and/or the image URL."""
+        value = description.encode("utf-8")
+        items = []
+        if key is not None:
+            items.append((key, value))
+        if url is not None:
+            items.append((url_key(url), value))
+        if items:
+            self.set_many(items)
+
+
+def result_set_key(results):
+    """Order-independent fingerprint of the retrieved chunks (url + text) behind an answer."""
+    keys = sorted(embedding_key(str(r["url"]), str(r["contents"])) for r in results)
+    return hashlib.sha256("\n".join(keys).encode("ascii")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    In-process cache of {answer, links} responses.
+
+    A lookup hits when a stored query embedding has cosine similarity >= threshold with
+    the new one AND the same chunks were retrieved for it. Entries expire after ttl
+    seconds and the least recently used one is evicted when full. Indexes are only
+    loaded at startup and the cache lives in the process, so the restart that picks up
+    a rebuilt index also empties it.
+    """
+
+    def __init__(self, threshold=0.95, ttl=3600, max_entries=1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.vectors = None  # (max_entries, dim) normalized query embeddings, allocated on first put
+        self.valid = np.zeros(max_entries, dtype=bool)
+        self.created = np.zeros(max_entries)
+        self.last_used = np.zeros(max_entries)
+        self.result_keys = [None] * max_entries
+        self.responses = [None] * max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _normalize(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding, result_key):
+        # No query embedding (lexical fallback): nothing to compare against
+        if embedding is None:
+            self.misses += 1
+            return None
+        now = time.time()
+        self.valid &= self.created > now - self.ttl
+        if self.vectors is None or not self.valid.any():
+            self.misses += 1
+            return None
+        scores = self.vectors @ self._normalize(embedding)
+        scores[~self.valid] = -np.inf
+        for slot in np.argsort(-scores):
+            if scores[slot] < self.threshold:
+                break
+            if self.result_keys[slot] == result_key:
+                self.last_used[slot] = now
+                self.hits += 1
+                return self.responses[slot]
+        self.misses += 1
+        return None
+
+    def put(self, embedding, result_key, response):
+        if embedding is None:
+            return
+        vector = self._normalize(embedding)
+        if self.vectors is None:
+            self.vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+        free = np.flatnonzero(~self.valid)
+        if len(free):
+            slot = free[0]
+        else:
+            slot = int(np.argmin(self.last_used))
+            self.evictions += 1
+        now = time.time()
+        self.vectors[slot] = vector
+        self.valid[slot] = True
+        self.created[slot] = now
+        self.last_used[slot] = now
+        self.result_keys[slot] = result_key
+        self.responses[slot] = response
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": int(self.valid.sum()),
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,97 @@
+"""
+Append-only JSONL checkpoint log for ingestion runs.
+
+Each line is one embedded chunk: {"key", "url", "chunk", "embedding"} where key is
+chunk_key(url, chunk) and the embedding is base64-encoded float32. Records are written
+one embedding batch at a time and fsynced, so a crash loses at most the batch in flight.
+Resuming is a single streaming read that skips every key already in the log.
+"""
+import base64
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def chunk_key(url, chunk):
+    return hashlib.sha256(f"{url}\0{chunk}".encode("utf-8")).hexdigest()
+
+
+def encode_embedding(embedding):
+    return base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def decode_embedding(encoded):
+    return np.frombuffer(base64.b64decode(encoded), dtype=np.float32)
+
+
+class CheckpointLog:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = None
+
+    def load(self):
+        """Stream the log into {key: record}; a torn last line from a crash is ignored."""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                record["embedding"] = decode_embedding(record["embedding"])
+                records[record["key"]] = record
+        return records
+
+    def _drop_torn_tail(self):
+        # Cut a partial last line so the next record doesn't get glued onto it
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b"\n":
+                return
+            # Scan backwards for the last complete line
+            pos = end
+            while pos > 0:
+                step = min(65536, pos)
+                pos -= step
+                f.seek(pos)
+                newline = f.read(step).rfind(b"\n")
+                if newline != -1:
+                    f.truncate(pos + newline + 1)
+                    return
+            f.truncate(0)
+
+    def append(self, records):
+        """Append one batch of {"key", "url", "chunk", "embedding"} records and fsync it."""
+        if self.file is None:
+            self._drop_torn_tail()
+            self.file = open(self.path, "a", encoding="utf-8")
+        lines = []
+        for record in records:
+            lines.append(json.dumps({**record, "embedding": encode_embedding(record["embedding"])},
+                                    ensure_ascii=False) + "\n")
+        self.file.write("".join(lines))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def clear(self):
+        """Remove the log once its records are safely in the index."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
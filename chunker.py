@@ -0,0 +1,87 @@
+"""
+Single-pass chunker for ingestion.
+
+The text is walked once, one chunk-sized window at a time. Each chunk holds at most
+max_tokens (estimated at ~4 characters per token, like helper.estimate_tokens) and ends
+at the best boundary inside its window: the last paragraph break (blank line) in the
+second half of the window, else the last sentence end, else the last line break or
+space. When a chunk ends mid-paragraph, the next one starts with the previous chunk's
+last sentence if that is shorter than overlap_tokens. Within a chunk, blank lines are
+kept as paragraph breaks and all other whitespace collapses to single spaces.
+
+Every chunk carries the [start, end) offsets of the source text it was cut from.
+"""
+import re
+from collections import namedtuple
+
+from config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+
+Chunk = namedtuple("Chunk", ["text", "start", "end"])
+
+CHARS_PER_TOKEN = 4
+
+PARAGRAPH_BREAK = re.compile(r"\n[ \t\r\f\v]*\n")
+SENTENCE_ENDS = (". ", "? ", "! ", ".\n", "?\n", "!\n")
+NON_SPACE = re.compile(r"\S")
+
+
+def _skip_space(text, pos):
+    match = NON_SPACE.search(text, pos)
+    return match.start() if match else len(text)
+
+
+def _last_paragraph_break(text, lo, hi):
+    last = -1
+    for match in PARAGRAPH_BREAK.finditer(text, lo, hi):
+        last = match.start()
+    return last
+
+
+def _last_sentence_end(text, lo, hi):
+    """Offset just past the last sentence-ending punctuation in text[lo:hi], or -1."""
+    end = max(text.rfind(marker, lo, hi) for marker in SENTENCE_ENDS)
+    return end + 1 if end != -1 else -1
+
+
+def _cut(text, start, limit, max_chars):
+    """(end, at_paragraph) for a chunk starting at start that must end by limit."""
+    end = _last_paragraph_break(text, start + max_chars // 2, limit)
+    if end > start:
+        return end, True
+    for end in (_last_sentence_end(text, start + 1, limit),
+                text.rfind("\n", start + 1, limit),
+                text.rfind(" ", start + 1, limit)):
+        if end > start:
+            return end, False
+    return limit, False
+
+
+def _chunk(text, start, end):
+    # Paragraphs are kept; other whitespace (incl. single newlines) collapses to one space
+    paragraphs = (" ".join(paragraph.split()) for paragraph in PARAGRAPH_BREAK.split(text[start:end]))
+    return Chunk("\n\n".join(paragraph for paragraph in paragraphs if paragraph), start, end)
+
+
+def iter_chunks(text, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Yield Chunk(text, start, end) for text, in order."""
+    if not text:
+        return
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = overlap_tokens * CHARS_PER_TOKEN
+
+    start = _skip_space(text, 0)
+    while start < len(text):
+        limit = start + max_chars
+        if limit >= len(text):
+            yield _chunk(text, start, len(text.rstrip()))
+            return
+        end, at_paragraph = _cut(text, start, limit, max_chars)
+        yield _chunk(text, start, end)
+
+        next_start = _skip_space(text, end)
+        if not at_paragraph:
+            # Repeat the last sentence of this chunk when it is short enough
+            overlap = _last_sentence_end(text, max(start + 1, end - overlap_chars), end - 1)
+            if overlap != -1:
+                next_start = _skip_space(text, overlap)
+        start = next_start
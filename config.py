@@ -9,6 +9,73 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY5")
 GEMINI_API_KEY2 = os.getenv("GEMINI_API_KEY2")
 APIS_LIST = os.getenv('API_LIST')
 OPEN_API_KEY = os.getenv('OPEN_API_KEY')
+AIPIPE_BASE_URL = os.getenv('AIPIPE_BASE_URL', 'https://aipipe.org/openai/v1')
+
+# Shared upstream HTTP connection pool (see http_client.py)
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', '20'))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '60'))
+HTTP2_ENABLED = os.getenv('HTTP2_ENABLED', '1') == '1'
+
+# Retrieval: "exact" brute-force search or "ivf" approximate search (needs ivf.npz, see ann.py)
+SEARCH_MODE = os.getenv('SEARCH_MODE', 'exact')
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', '8'))
+IVF_NLIST = int(os.getenv('IVF_NLIST', '0'))  # 0 = ~4*sqrt(N) lists
+# First-pass codes kept in memory: none, float16, int8, binary, or the prefix256/prefix512
+# Matryoshka prefilter (see quantize.py); the best QUANTIZED_SHORTLIST rows are then
+# rescored against the full-precision embeddings. Ingestion saves the codes for this setting
+# with the index; other settings compute theirs at startup
+QUANTIZATION = os.getenv('QUANTIZATION', 'none')
+QUANTIZED_SHORTLIST = int(os.getenv('QUANTIZED_SHORTLIST', '200'))
+# "dense" ranks by cosine only, "hybrid" fuses in BM25 (see search.hybrid_search_indexes)
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'dense')
+HYBRID_LEXICAL_WEIGHT = float(os.getenv('HYBRID_LEXICAL_WEIGHT', '0.3'))
+# Seconds to wait for the query embedding before answering from BM25 alone (0 = no deadline)
+EMBEDDING_DEADLINE = float(os.getenv('EMBEDDING_DEADLINE', '3'))
+# Concurrent questions arriving within this many milliseconds (up to QUERY_BATCH_MAX) are
+# embedded with one /embeddings request and searched as one batch (see batcher.py)
+QUERY_BATCH_WINDOW_MS = float(os.getenv('QUERY_BATCH_WINDOW_MS', '5'))
+QUERY_BATCH_MAX = int(os.getenv('QUERY_BATCH_MAX', '32'))
+
+# Embedding provider quota and how many batches ingestion keeps in flight
+EMBEDDING_RPM = int(os.getenv('EMBEDDING_RPM', '3000'))
+EMBEDDING_TPM = int(os.getenv('EMBEDDING_TPM', '1000000'))
+INGEST_CONCURRENCY = int(os.getenv('INGEST_CONCURRENCY', '8'))
+
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', '0'))  # text extraction processes, 0 = one per CPU
+
+# Persistent embedding cache shared by ingestion and query embedding (see cache.py). If the
+# path can't be opened for writing (read-only deployments) the cache is kept in memory only
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', 'embeddings/embedding_cache.sqlite')
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '200000'))
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MEMORY_ENTRIES', '2048'))
+# Seconds a query's cache lookup/write waits for a write lock held by an ingestion run
+# before it counts as a miss (ingestion itself waits SQLite's default 5 s)
+CACHE_BUSY_TIMEOUT = float(os.getenv('CACHE_BUSY_TIMEOUT', '0.05'))
+
+# Semantic answer cache in front of generate_answer (see cache.SemanticAnswerCache)
+ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.95'))
+ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', '3600'))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '1024'))
+# Persistent OCR cache of image descriptions, shared by ingestion and queries (see cache.OCRCache);
+# kept in memory only when the path isn't writable
+OCR_CACHE_PATH = os.getenv('OCR_CACHE_PATH', 'embeddings/ocr_cache.sqlite')
+OCR_CACHE_MAX_ENTRIES = int(os.getenv('OCR_CACHE_MAX_ENTRIES', '20000'))
+# Answer prompt context (see context.py): total and per-passage budgets in estimated
+# tokens, and the relevance/diversity trade-off of the MMR ordering (1 = relevance only)
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000'))
+CONTEXT_MAX_RESULT_TOKENS = int(os.getenv('CONTEXT_MAX_RESULT_TOKENS', '500'))
+CONTEXT_MMR_LAMBDA = float(os.getenv('CONTEXT_MMR_LAMBDA', '0.7'))
+
+# Image pre-processing before the vision call (see image_prep.py). gpt-4o-mini scales
+# images to fit 2048x2048 and then to 768px on the short side, so larger is wasted upload
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', str(20 * 1024 * 1024)))
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', '2048'))
+IMAGE_MAX_SHORT_SIDE = int(os.getenv('IMAGE_MAX_SHORT_SIDE', '768'))
+IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '85'))
+# Chunk size for ingestion in (estimated) tokens; see chunker.py
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '2000'))  # ~8000 characters
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '25'))
 IMG_GENERATION_PROMPT = """Perform Optical Character Recognition (OCR) on the provided image to extract all readable text accurately. Follow these steps:
 
             1. Analyze the input image or document containing text
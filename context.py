@@ -0,0 +1,120 @@
+"""
+Builds the context block of the answer prompt from retrieved results.
+
+1. Chunks of the same URL that overlap (the chunker repeats a sentence across chunk
+   boundaries) or contain one another are merged into one passage.
+2. Passages are ordered by maximal marginal relevance over their embeddings, so a
+   near-duplicate of something already picked drops down the list.
+3. Passages are packed in that order into CONTEXT_TOKEN_BUDGET estimated tokens, each
+   capped at CONTEXT_MAX_RESULT_TOKENS.
+"""
+import numpy as np
+
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_MAX_RESULT_TOKENS, CONTEXT_MMR_LAMBDA
+from helper import estimate_tokens
+
+# How far into the end of one chunk the start of the next is looked for
+OVERLAP_WINDOW = 2000
+# Shortest shared text that counts as an overlap rather than a coincidence
+MIN_OVERLAP = 20
+# A passage is only truncated into the remaining budget if at least this much is left
+MIN_PASSAGE_TOKENS = 50
+
+
+def _join(first, second):
+    """first and second as one text if one contains the other or they overlap, else None."""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    head = second[:MIN_OVERLAP]
+    if len(head) < MIN_OVERLAP:
+        return None
+    pos = first.find(head, max(0, len(first) - OVERLAP_WINDOW))
+    while pos != -1:
+        if second.startswith(first[pos:]):
+            return first[:pos] + second
+        pos = first.find(head, pos + 1)
+    return None
+
+
+def _merge_embeddings(a, b):
+    if a is None or b is None:
+        return a if b is None else b
+    merged = np.asarray(a, dtype=np.float32) + np.asarray(b, dtype=np.float32)
+    norm = np.linalg.norm(merged)
+    return merged / norm if norm else merged
+
+
+def merge_overlapping(results):
+    """Merge results of the same source/URL whose texts overlap; keeps the best similarity."""
+    groups = {}
+    for result in results:
+        groups.setdefault((result["source"], result["url"]), []).append(result)
+
+    passages = []
+    for group in groups.values():
+        merged = []
+        for result in group:
+            current = dict(result)
+            # A merged passage can now bridge two earlier ones, so keep merging until stable
+            changed = True
+            while changed:
+                changed = False
+                for other in merged:
+                    text = _join(other["contents"], current["contents"]) or _join(current["contents"], other["contents"])
+                    if text is not None:
+                        merged.remove(other)
+                        current["contents"] = text
+                        current["similarity"] = max(other["similarity"], current["similarity"])
+                        current["embedding"] = _merge_embeddings(other.get("embedding"), current.get("embedding"))
+                        changed = True
+                        break
+            merged.append(current)
+        passages.extend(merged)
+    return passages
+
+
+def mmr_order(passages, mmr_lambda=CONTEXT_MMR_LAMBDA):
+    """Passages in maximal-marginal-relevance order (plain similarity order without embeddings)."""
+    if len(passages) < 3 or any(p.get("embedding") is None for p in passages):
+        return sorted(passages, key=lambda p: p["similarity"], reverse=True)
+    embeddings = np.array([p["embedding"] for p in passages], dtype=np.float32)
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    relevance = np.array([p["similarity"] for p in passages], dtype=np.float32)
+    pairwise = embeddings @ embeddings.T
+
+    order = []
+    redundancy = np.full(len(passages), -np.inf, dtype=np.float32)  # max similarity to anything picked
+    available = np.ones(len(passages), dtype=bool)
+    for _ in range(len(passages)):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        scores = np.where(available, mmr_lambda * relevance - (1 - mmr_lambda) * penalty, -np.inf)
+        pick = int(np.argmax(scores))
+        order.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, pairwise[pick], out=redundancy)
+    return [passages[i] for i in order]
+
+
+def _truncate(text, max_tokens):
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text.rfind(" ", 0, max_tokens * 4)
+    return text[:cut if cut > 0 else max_tokens * 4]
+
+
+def build_context(results, token_budget=CONTEXT_TOKEN_BUDGET, max_result_tokens=CONTEXT_MAX_RESULT_TOKENS):
+    """The prompt context for the retrieved results, within token_budget estimated tokens."""
+    context = ""
+    remaining = token_budget
+    for passage in mmr_order(merge_overlapping(results)):
+        source_type = "Discourse post" if passage["source"] == "discourse" else "Documentation"
+        header = f"\n\n{source_type} (URL: {passage['url']}):\n"
+        available = min(max_result_tokens, remaining - estimate_tokens(header))
+        if available < MIN_PASSAGE_TOKENS:
+            break
+        text = _truncate(passage["contents"], available)
+        context += header + text
+        remaining -= estimate_tokens(header + text)
+    return context
@@ -1,60 +1,160 @@
-from google.genai import Client, types
-from helper import RateLimiter, bytes_to_data_url
-import re
+from helper import AsyncRateLimiter, bytes_to_data_url, estimate_tokens
+import json
 import asyncio
 import base64
-from config import IMG_GENERATION_PROMPT
-import httpx
+from config import (IMG_GENERATION_PROMPT, EMBEDDING_RPM, EMBEDDING_TPM, INGEST_CONCURRENCY, AIPIPE_BASE_URL,
+                    CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS)
+from chunker import iter_chunks
+from context import build_context
+from image_prep import check_base64_size, prepare_image
+from http_client import get_client, EMBEDDINGS_TIMEOUT, CHAT_TIMEOUT, VISION_TIMEOUT
+from metrics import UPSTREAM_RETRIES, UPSTREAM_FAILURES
 
-rate_limiter = RateLimiter(requests_per_minute=50, requests_per_second=60)
+# Shared by every /embeddings call in this process
+rate_limiter = AsyncRateLimiter(requests_per_minute=EMBEDDING_RPM, tokens_per_minute=EMBEDDING_TPM)
 
-# rate_limiter = AsyncLimiter(5, 60)  # 5 requests per 60 seconds
+EMBEDDINGS_URL = f"{AIPIPE_BASE_URL}/embeddings"
+CHAT_COMPLETIONS_URL = f"{AIPIPE_BASE_URL}/chat/completions"
+EMBEDDING_MODEL = "text-embedding-3-small"
 
-async def get_embeddings(text, api_key, model="gemini-embedding-exp-03-07", max_tries=10):
-    # api_key = api_keys[0]
-    # client = Client(api_key=api_key)
+# /embeddings accepts at most 2048 inputs and ~300k tokens per request; stay well below
+MAX_BATCH_SIZE = 128
+MAX_BATCH_CHARS = 400_000  # ~100k tokens at ~4 chars/token
+
+
+async def _post_embeddings(inputs, api_key, max_tries=10, client=None):
+    """POST one /embeddings request (a string or list of strings) with retries; returns the data list."""
     headers = {
         "Authorization": api_key,
         "Content-Type": "application/json"
     }
     payload = {
-        "model": "text-embedding-3-small",
-        "input": text
+        "model": EMBEDDING_MODEL,
+        "input": inputs
     }
-    timeout = httpx.Timeout(30.0, connect=10.0)
+    client = client or get_client()
+    tokens = sum(estimate_tokens(text) for text in ([inputs] if isinstance(inputs, str) else inputs))
     
     for attempt in range(max_tries):
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post("https://aipipe.org/openai/v1/embeddings", headers=headers, json=payload)
-                response.raise_for_status()  # Raise an exception for bad status codes
-                return response.json()["data"][0]["embedding"]  # Return JSON directly
-            # rate_limiter.wait()
-            # response = client.models.embed_content(
-            #     model=model,
-            #     contents=text
-            # )
-            # return response.embeddings[0].values
+            await rate_limiter.acquire(tokens)
+            response = await client.post(EMBEDDINGS_URL, headers=headers, json=payload, timeout=EMBEDDINGS_TIMEOUT)
+            response.raise_for_status()  # Raise an exception for bad status codes
+            return response.json()["data"]
         except Exception as e:
             if "rate limit" in str(e).lower() or "quota" in str(e).lower():
                 wait_time = 2 ** attempt
+                UPSTREAM_RETRIES.inc("embeddings", "rate_limit")
                 print(f"Rate limit exceeded, retrying in {wait_time} seconds...")
-                # api_key = api_keys[1]
                 await asyncio.sleep(wait_time)
             elif attempt == max_tries - 1:
+                UPSTREAM_FAILURES.inc("embeddings")
                 print(f"Failed to get embeddings after {max_tries} attempts: {e}")
                 raise
             else:
+                UPSTREAM_RETRIES.inc("embeddings", "error")
                 print(f'attempt {attempt + 1} failed with error: {e}, retrying...')
                 await asyncio.sleep(1)
 
 
-async def describe_base64_image(base64_image, api_key, max_tries, question):
-    # Decode the base64 string to bytes
-    image_bytes = base64.b64decode(base64_image)
-    image_data_url = bytes_to_data_url(image_bytes)
-    # client = Client(api_key=api_key)
-    url = "https://aipipe.org/openai/v1/chat/completions"
+async def get_embeddings(text, api_key, model="gemini-embedding-exp-03-07", max_tries=10, client=None, cache=None):
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get_embeddings, [text], EMBEDDING_MODEL)
+        if cached:
+            return cached[0]
+    data = await _post_embeddings(text, api_key, max_tries, client)
+    embedding = data[0]["embedding"]
+    if cache is not None:
+        await asyncio.to_thread(cache.set_embeddings, [text], [embedding], EMBEDDING_MODEL)
+    return embedding
+
+
+def split_batches(texts, max_batch_size=MAX_BATCH_SIZE, max_batch_chars=MAX_BATCH_CHARS):
+    """Yield (start, end) slices of texts that respect both the count and the character budget."""
+    start = 0
+    batch_chars = 0
+    for i, text in enumerate(texts):
+        if i > start and (i - start >= max_batch_size or batch_chars + len(text) > max_batch_chars):
+            yield start, i
+            start, batch_chars = i, 0
+        batch_chars += len(text)
+    if start < len(texts):
+        yield start, len(texts)
+
+
+async def get_embeddings_batch(texts, api_key, max_batch_size=MAX_BATCH_SIZE,
+                               max_batch_chars=MAX_BATCH_CHARS, max_tries=10, client=None, cache=None):
+    """
+    Embed a list of texts with as few requests as possible.
+
+    Results come back in input order. Texts found in the optional EmbeddingCache are not
+    sent; each remaining batch is retried on its own, so a failure only re-sends that batch.
+    The cache is read and written in a worker thread so a locked store never stalls the loop.
+    """
+    embeddings = [None] * len(texts)
+    if cache is not None:
+        for i, embedding in (await asyncio.to_thread(cache.get_embeddings, texts, EMBEDDING_MODEL)).items():
+            embeddings[i] = embedding
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    missing_texts = [texts[i] for i in missing]
+
+    for start, end in split_batches(missing_texts, max_batch_size, max_batch_chars):
+        data = await _post_embeddings(missing_texts[start:end], api_key, max_tries, client)
+        # The API reports each input's position; don't rely on response order
+        batch = [None] * (end - start)
+        for item in data:
+            batch[item["index"]] = item["embedding"]
+        for offset, embedding in enumerate(batch):
+            embeddings[missing[start + offset]] = embedding
+        if cache is not None:
+            await asyncio.to_thread(cache.set_embeddings, missing_texts[start:end], batch, EMBEDDING_MODEL)
+    return embeddings
+
+
+async def iter_embedding_batches(texts, api_key, concurrency=INGEST_CONCURRENCY,
+                                 max_batch_size=MAX_BATCH_SIZE, max_batch_chars=MAX_BATCH_CHARS, client=None,
+                                 cache=None):
+    """
+    Embed texts with up to `concurrency` batch requests in flight.
+
+    Yields (start, end, embeddings, error) per batch in input order; embeddings is None
+    and error is set when a batch failed after its retries.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(start, end):
+        async with semaphore:
+            try:
+                embeddings = await get_embeddings_batch(texts[start:end], api_key, max_batch_size,
+                                                        max_batch_chars, client=client, cache=cache)
+                return embeddings, None
+            except Exception as e:
+                return None, e
+
+    slices = list(split_batches(texts, max_batch_size, max_batch_chars))
+    tasks = [asyncio.create_task(run(start, end)) for start, end in slices]
+    try:
+        for (start, end), task in zip(slices, tasks):
+            embeddings, error = await task
+            yield start, end, embeddings, error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def describe_base64_image(base64_image, api_key, max_tries, question, client=None):
+    check_base64_size(base64_image)
+    image_bytes = await asyncio.to_thread(base64.b64decode, base64_image)
+    return await describe_image_bytes(image_bytes, api_key, max_tries, question, client)
+
+
+async def describe_image_bytes(image_bytes, api_key, max_tries, question, client=None):
+    # Downsampling and re-encoding take hundreds of ms for large photos; run them in a worker
+    # thread so the event loop keeps serving other requests. Byte savings are totalled in
+    # image_prep.image_stats (served on /metrics)
+    image_bytes, mime_type, _ = await asyncio.to_thread(prepare_image, image_bytes)
+    image_data_url = bytes_to_data_url(image_bytes, mime_type)
+    client = client or get_client()
     headers = {
         "Authorization": api_key,
         "Content-Type": "application/json"
@@ -73,42 +173,30 @@ async def describe_base64_image(base64_image, api_key, max_tries, question):
         }
     for attempt in range(max_tries):
         try:
-            async with httpx.post(url, headers=headers, json=payload) as response:
-                if response.status == 200:
-                    # print(response)
-                    result = await response.json()
-                    image_description = result["choices"][0]["message"]["content"]
-                    return image_description
-            # response = client.models.generate_content(
-            #     model='gemini-2.0-flash',
-            #     contents=[
-            #         types.Part.from_bytes(
-            #             data=image_bytes,
-            #             mime_type='image/jpeg',  # or 'image/png' if your image is PNG
-            #         ),
-            #         IMG_GENERATION_PROMPT
-            #     ]
-            # )
-            # return response.text
-        
+            response = await client.post(CHAT_COMPLETIONS_URL, headers=headers, json=payload, timeout=VISION_TIMEOUT)
+            response.raise_for_status()
+            result = response.json()
+            return result["choices"][0]["message"]["content"]
         except Exception as e:
             if "rate limit" in str(e).lower() or "quota" in str(e).lower():
                 wait_time = 2 ** attempt
+                UPSTREAM_RETRIES.inc("vision", "rate_limit")
                 print(f"Rate limit exceeded, retrying in {wait_time} seconds...")
                 # api_key = api_keys[1]
                 await asyncio.sleep(wait_time)
             elif attempt == max_tries - 1:
-                print(f"Failed to get embeddings after {max_tries} attempts: {e}")
+                UPSTREAM_FAILURES.inc("vision")
+                print(f"Failed to describe image after {max_tries} attempts: {e}")
                 raise
             else:
+                UPSTREAM_RETRIES.inc("vision", "error")
                 print(f'attempt {attempt + 1} failed with error: {e}, retrying...')
                 await asyncio.sleep(1)
 
-async def generate_answer(API_KEY,  question, relevant_results, max_tries=5):
-    context = ""
-    for result in relevant_results:
-        source_type = "Discourse post" if result["source"] == "discourse" else "Documentation"
-        context += f"\n\n{source_type} (URL: {result['url']}):\n{result['contents'][:1500]}"
+def build_answer_request(API_KEY, question, relevant_results):
+    """Headers and chat payload for answering a question from the retrieved results."""
+    # Overlapping chunks merged, near-duplicates pushed down, packed into the token budget
+    context = build_context(relevant_results)
     
     prompt = f"""Answer the following question based ONLY on the provided context. 
     If you cannot answer the question based on the context, say "I don't have enough information to answer this question."
@@ -141,151 +229,83 @@ async def generate_answer(API_KEY,  question, relevant_results, max_tries=5):
             ],
             "temperature": 0.3
         }
-    timeout = httpx.Timeout(60.0, connect=10.0)
+    return headers, payload
+
+
+async def generate_answer(API_KEY,  question, relevant_results, max_tries=5, client=None):
+    headers, payload = build_answer_request(API_KEY, question, relevant_results)
+    client = client or get_client()
     
     for attempt in range(max_tries):
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post('https://aipipe.org/openai/v1/chat/completions', headers=headers, json=payload)
-                response.raise_for_status()
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
+            response = await client.post(CHAT_COMPLETIONS_URL, headers=headers, json=payload, timeout=CHAT_TIMEOUT)
+            response.raise_for_status()
+            result = response.json()
+            return result["choices"][0]["message"]["content"]
         except Exception as e:
             if "rate limit" in str(e).lower() or "quota" in str(e).lower():
                 wait_time = 2 ** attempt
+                UPSTREAM_RETRIES.inc("chat", "rate_limit")
                 print(f"Rate limit exceeded, retrying in {wait_time} seconds...")
                 # api_key = api_keys[1]
                 await asyncio.sleep(wait_time)
             elif attempt == max_tries - 1:
+                UPSTREAM_FAILURES.inc("chat")
                 print(f"Failed to get embeddings after {max_tries} attempts: {e}")
                 raise
             else:
+                UPSTREAM_RETRIES.inc("chat", "error")
                 print(f'attempt {attempt + 1} failed with error: {e}, retrying...')
                 await asyncio.sleep(1)
-                
 
-def get_chunks(text, chunk_overlap: int = 100, max_embedding_chars: int = 8000):
-    if not text:
-        return []
-    
-    chunks = []
-    
-    # Clean up whitespace and newlines, preserving meaningful paragraph breaks
-    text = re.sub(r'\n+', '\n', text)  # Replace multiple newlines with single
-    text = re.sub(r'\s+', ' ', text)   # Replace multiple spaces with single
-    text = text.strip()
-    
-    # Apply embedding limit constraint - ensure chunk_size doesn't exceed embedding limit
-    # effective_chunk_size = min(chunk_size, max_embedding_chars)
-    
-    # If text is very short, return it as a single chunk
-    if len(text) <= max_embedding_chars:
-        return [text]
-    
-    # Split text by paragraphs for more meaningful chunks
-    paragraphs = text.split('\n')
-    current_chunk = ""
+
+async def generate_answer_stream(API_KEY, question, relevant_results, max_tries=5, client=None):
+    """
+    Stream the answer completion, yielding content deltas as they arrive.
+
+    Retries only happen before the first delta; once text has been yielded a failure
+    is raised to the caller instead of restarting the answer.
+    """
+    headers, payload = build_answer_request(API_KEY, question, relevant_results)
+    payload["stream"] = True
+    client = client or get_client()
     
-    for i, para in enumerate(paragraphs):
-        # If this paragraph alone exceeds chunk size, we need to split it further
-        if len(para) > max_embedding_chars:
-            # If we have content in the current chunk, store it first
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-                current_chunk = ""
-            
-            # Split the paragraph into sentences
-            sentences = re.split(r'(?<=[.!?])\s+', para)
-            sentence_chunk = ""
-            
-            for sentence in sentences:
-                # If single sentence exceeds chunk size, split by chunks with overlap
-                if len(sentence) > max_embedding_chars:
-                    # If we have content in the sentence chunk, store it first
-                    if sentence_chunk:
-                        chunks.append(sentence_chunk.strip())
-                        sentence_chunk = ""
-                    
-                    # Process the long sentence in chunks with embedding limit consideration
-                    for j in range(0, len(sentence), max_embedding_chars - chunk_overlap):
-                        sentence_part = sentence[j:j + max_embedding_chars]
-                        if sentence_part:
-                            chunks.append(sentence_part.strip())
-                
-                # If adding this sentence would exceed chunk size, save current and start new
-                elif len(sentence_chunk) + len(sentence) > max_embedding_chars and sentence_chunk:
-                    chunks.append(sentence_chunk.strip())
-                    sentence_chunk = sentence
-                else:
-                    # Add to current sentence chunk
-                    if sentence_chunk:
-                        sentence_chunk += " " + sentence
-                    else:
-                        sentence_chunk = sentence
-            
-            # Add any remaining sentence chunk
-            if sentence_chunk:
-                chunks.append(sentence_chunk.strip())
-            
-        # Normal paragraph handling - if adding would exceed chunk size
-        elif len(current_chunk) + len(para) > max_embedding_chars and current_chunk:
-            chunks.append(current_chunk.strip())
-            # Start new chunk with this paragraph
-            current_chunk = para
-        else:
-            # Add to current chunk
-            if current_chunk:
-                current_chunk += " " + para
+    for attempt in range(max_tries):
+        started = False
+        try:
+            async with client.stream("POST", CHAT_COMPLETIONS_URL, headers=headers, json=payload,
+                                     timeout=CHAT_TIMEOUT) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        return
+                    choices = json.loads(data).get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        started = True
+                        yield delta
+            return
+        except Exception as e:
+            if started:
+                raise
+            if "rate limit" in str(e).lower() or "quota" in str(e).lower():
+                wait_time = 2 ** attempt
+                UPSTREAM_RETRIES.inc("chat_stream", "rate_limit")
+                print(f"Rate limit exceeded, retrying in {wait_time} seconds...")
+                await asyncio.sleep(wait_time)
+            elif attempt == max_tries - 1:
+                UPSTREAM_FAILURES.inc("chat_stream")
+                print(f"Failed to stream answer after {max_tries} attempts: {e}")
+                raise
             else:
-                current_chunk = para
-    
-    # Add the last chunk if it's not empty
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-    
-    # Verify we have chunks and apply overlap between chunks
-    if chunks:
-        # Create new chunks list with proper overlap
-        overlapped_chunks = [chunks[0]]
-        
-        for i in range(1, len(chunks)):
-            prev_chunk = chunks[i-1]
-            current_chunk = chunks[i]
-            
-            # If the previous chunk ends with a partial sentence, find where it begins
-            if len(prev_chunk) > chunk_overlap:
-                # Find a good breaking point for overlap
-                overlap_start = max(0, len(prev_chunk) - chunk_overlap)
-                # Try to find sentence boundary
-                sentence_break = prev_chunk.rfind('. ', overlap_start)
-                if sentence_break != -1 and sentence_break > overlap_start:
-                    overlap = prev_chunk[sentence_break+2:]
-                    if overlap and not current_chunk.startswith(overlap):
-                        # Ensure the overlapped chunk doesn't exceed embedding limit
-                        proposed_chunk = overlap + " " + current_chunk
-                        if len(proposed_chunk) <= max_embedding_chars:
-                            current_chunk = proposed_chunk
-                        # If it would exceed limit, truncate the overlap
-                        else:
-                            available_space = max_embedding_chars - len(current_chunk) - 1
-                            if available_space > 0:
-                                truncated_overlap = overlap[:available_space]
-                                current_chunk = truncated_overlap + " " + current_chunk
+                UPSTREAM_RETRIES.inc("chat_stream", "error")
+                print(f'attempt {attempt + 1} failed with error: {e}, retrying...')
+                await asyncio.sleep(1)
                 
-            overlapped_chunks.append(current_chunk)
-        
-        # Final validation: ensure no chunk exceeds embedding limit
-        validated_chunks = []
-        for chunk in overlapped_chunks:
-            if len(chunk) <= max_embedding_chars:
-                validated_chunks.append(chunk)
-            else:
-                # If a chunk still exceeds limit, split it further
-                for j in range(0, len(chunk), max_embedding_chars - chunk_overlap):
-                    subchunk = chunk[j:j + max_embedding_chars]
-                    if subchunk:
-                        validated_chunks.append(subchunk.strip())
-        
-        return validated_chunks
-    
-    return chunks
+
+def get_chunks(text, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Chunk texts for embedding; see chunker.iter_chunks for offsets."""
+    return [chunk.text for chunk in iter_chunks(text, max_tokens, overlap_tokens)]
@@ -1,8 +1,59 @@
 import frontmatter
+import html
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from markdown import markdown
 from bs4 import BeautifulSoup
 
+from config import EXTRACT_WORKERS
+
+# A start or end tag, with quoted attribute values allowed to contain '>'
+TAG = re.compile(r"""</?[A-Za-z][^<>"']*(?:(?:"[^"]*"|'[^']*')[^<>"']*)*>""")
+# Markup the fast path leaves to BeautifulSoup: comments/doctype/CDATA, processing
+# instructions, and elements whose text html.parser/get_text treat specially
+COMPLEX_MARKUP = re.compile(r"<[!?]|<(?:script|style|template)\b", re.IGNORECASE)
+# bs4 decodes entities itself, differently from html.unescape for unusual ones; the fast
+# path only accepts these plus plain numeric references
+SIMPLE_ENTITIES = {"amp", "lt", "gt", "quot", "nbsp"}
+ENTITY = re.compile(r"&(?:#([0-9]{1,7});|#[xX]([0-9a-fA-F]{1,6});|([a-zA-Z][a-zA-Z0-9]*);|([#a-zA-Z]))?")
+
+
+def _simple_entities(text):
+    for match in ENTITY.finditer(text):
+        decimal, hexadecimal, name, other = match.groups()
+        if other or (name and name not in SIMPLE_ENTITIES):
+            return False
+        if decimal or hexadecimal:
+            code = int(decimal, 10) if decimal else int(hexadecimal, 16)
+            if not (32 <= code < 127 or 160 <= code < 0xD800 or 0xE000 <= code <= 0x10FFFF):
+                return False
+    return True
+
+
+def html_strings(html_content):
+    """
+    The text strings BeautifulSoup(html_content, 'html.parser') would hold, in document
+    order, for simple HTML (what markdown() and Discourse 'cooked' usually produce).
+    Returns None when the HTML needs the real parser.
+    """
+    if COMPLEX_MARKUP.search(html_content):
+        return None
+    pieces = TAG.split(html_content)
+    strings = []
+    for piece in pieces:
+        if not piece:
+            continue
+        if "<" in piece:
+            # Not a tag the fast path understands (or stray '<'); let html.parser decide
+            return None
+        if "&" in piece:
+            if not _simple_entities(piece):
+                return None
+            piece = html.unescape(piece)
+        strings.append(piece)
+    return strings
+
 def extract_text_from_markdown(filepath):
     # Load markdown file and extract frontmatter
     post = frontmatter.load(filepath)
@@ -18,9 +69,13 @@ def extract_text_from_markdown(filepath):
     content = re.sub(r'^\[(Previous|Next)[\s\S]*?\]\([^\)]*\)\s*', '', content, flags=re.MULTILINE|re.IGNORECASE)
     
     # Convert markdown to HTML, then HTML to plain text
-    html = markdown(content)
-    soup = BeautifulSoup(html, "html.parser")
-    plain_text = soup.get_text(separator='\n')
+    html_content = markdown(content)
+    strings = html_strings(html_content)
+    if strings is not None:
+        plain_text = '\n'.join(strings)
+    else:
+        soup = BeautifulSoup(html_content, "html.parser")
+        plain_text = soup.get_text(separator='\n')
 
     return plain_text.strip(), original_url
 
@@ -29,6 +84,11 @@ def clean_html(html_content):
     if not html_content:
         return ""
     
+    # Simple HTML doesn't need a parse tree: same strings, same whitespace clean-up
+    strings = html_strings(html_content)
+    if strings is not None:
+        return re.sub(r'\s+', ' ', ' '.join(strings)).strip()
+    
     # Use BeautifulSoup to parse HTML
     soup = BeautifulSoup(html_content, 'html.parser')
     
@@ -43,3 +103,30 @@ def clean_html(html_content):
     return text
 
 
+def extract_discourse_topic(file_path):
+    """
+    (topic id, slug, [(post text, first europe1 image URL or None), ...]) for one
+    Discourse topic JSON file.
+    """
+    from helper import read_json_file, extract_europe1_urls
+    data = read_json_file(file_path)
+    posts = []
+    for post in data.get('post_stream', {}).get('posts', []):
+        content = post.get('cooked', '')
+        img_urls = extract_europe1_urls(content)
+        posts.append((clean_html(content), img_urls[0] if img_urls else None))
+    return data.get('id'), data.get('slug', ''), posts
+
+
+def extract_files(extract, paths, workers=EXTRACT_WORKERS):
+    """
+    [extract(path) for path in paths], spread over a process pool (extraction is CPU
+    bound). workers=0 means one per CPU; 1 or a single file runs in this process.
+    """
+    paths = list(paths)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(paths) <= 1:
+        return [extract(path) for path in paths]
+    workers = min(workers, len(paths))
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(extract, paths, chunksize=max(1, len(paths) // (workers * 4))))
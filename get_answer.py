@@ -1,54 +1,96 @@
 import re
-from helper import cosine_similarity
-
-
-def find_similar_content(query_embedding, MAX_SIMILAR_TEXT, discourse_data, markdown_data):
-    results = []
-    
-    # Search discourse chunks
-    print("Searching discourse chunks for similar content...")
-    embeddings = discourse_data['embeddings']
-    contents = discourse_data['chunks']
-    urls = discourse_data['original_urls']
-    
-    for i, embedding in enumerate(embeddings):            
-            similarity = cosine_similarity(query_embedding, embedding)
-            if similarity >= 0.5:
-                results.append({
-                    "source": "discourse",
-                    "url": urls[i] if i < len(urls) else "",
-                    "contents": contents[i] if i < len(contents) else "",
-                    "similarity": similarity
-                })
-    
-    # Search markdown chunks
-    print("Searching markdown chunks for similar contents...")
-    embeddings = markdown_data['embeddings']
-    contents = markdown_data['chunks']
-    urls = markdown_data['original_urls']
-    
-    for i, embedding in enumerate(embeddings):            
-            similarity = cosine_similarity(query_embedding, embedding)
-            if similarity >= 0.5:
-                results.append({
-                    "source": "markdown",
-                    "url": urls[i] if i < len(urls) else "",
-                    "contents": contents[i] if i < len(contents) else "",
-                    "similarity": similarity
-                })
-    
-    # Sort by similarity and return top results
-    results.sort(key=lambda x: x["similarity"], reverse=True)
-    return results[:MAX_SIMILAR_TEXT]
+import numpy as np
+from lexical import tokenize
+from search import search_indexes, search_indexes_batch, hybrid_search_indexes, lexical_search_indexes
 
 
+def find_similar_content(query_embedding, MAX_SIMILAR_TEXT, discourse_index, markdown_index, threshold=0.5,
+                         question=None, lexical_weight=0.0):
+    """
+    Dense search by default. With the question text, lexical_weight > 0 fuses in BM25
+    scores (hybrid), and a missing query_embedding means BM25 alone (no API call needed).
+    """
+    indexes = [discourse_index, markdown_index]
+    if query_embedding is None:
+        hits = lexical_search_indexes(tokenize(question or ""), indexes, MAX_SIMILAR_TEXT)
+    elif question and lexical_weight > 0:
+        hits = hybrid_search_indexes(query_embedding, tokenize(question), indexes, MAX_SIMILAR_TEXT,
+                                     threshold, lexical_weight)
+    else:
+        # Search discourse and markdown chunks together with one matrix-vector product each
+        hits = search_indexes(query_embedding, indexes, MAX_SIMILAR_TEXT, threshold)
+    return _results(hits)
+
+
+def find_similar_content_batch(query_embeddings, MAX_SIMILAR_TEXT, discourse_index, markdown_index, threshold=0.5):
+    """Dense find_similar_content for several query embeddings, scored as one batch."""
+    hits = search_indexes_batch(query_embeddings, [discourse_index, markdown_index], MAX_SIMILAR_TEXT, threshold)
+    return [_results(query_hits) for query_hits in hits]
+
+
+def _results(hits):
+    return [
+        {
+            "source": index.source,
+            "url": index.url(i),
+            "contents": index.chunk(i),
+            "similarity": similarity,
+            # used to diversify the prompt context (see context.mmr_order)
+            "embedding": np.asarray(index.matrix[i], dtype=np.float32)
+        }
+        for index, i, similarity in hits
+    ]
+
+
+
+def merge_results(*result_lists, limit):
+    """Union of several find_similar_content results, keeping each chunk's best similarity."""
+    best = {}
+    for results in result_lists:
+        for result in results:
+            key = (result["source"], result["url"], result["contents"])
+            if key not in best or result["similarity"] > best[key]["similarity"]:
+                best[key] = result
+    return sorted(best.values(), key=lambda r: r["similarity"], reverse=True)[:limit]
+
+
+SOURCE_HEADINGS = ["Sources:", "Source:", "References:", "Reference:"]
+
+
+def parse_source_line(line):
+    """One line of the Sources section -> {"url", "text"} or None."""
+    line = line.strip()
+    if not line:
+        return None
+    # Remove list markers
+    line = re.sub(r'^\d+\.\s*', '', line)
+    line = re.sub(r'^-\s*', '', line)
+    # Extract URL and text
+    url_match = re.search(
+        r'URL:\s*\[(.*?)\]|url:\s*\[(.*?)\]|\[(http[^\]]+)\]|URL:\s*(http\S+)|url:\s*(http\S+)|(http\S+)',
+        line, re.IGNORECASE)
+    text_match = re.search(
+        r'Text:\s*\[(.*?)\]|text:\s*\[(.*?)\]|"(.*?)"|Text:\s*"(.*?)"|text:\s*"(.*?)"',
+        line, re.IGNORECASE)
+    if url_match:
+        url = next((g for g in url_match.groups() if g), "")
+        url = url.strip()
+        text = "Source reference"
+        if text_match:
+            text_value = next((g for g in text_match.groups() if g), "")
+            if text_value:
+                text = text_value.strip()
+        if url and url.startswith("http"):
+            return {"url": url, "text": text}
+    return None
+
 
 def parse_llm_response(response):
     try:
         # Split by "Sources:" or similar headings
         parts = response.split("Sources:", 1)
         if len(parts) == 1:
-            for heading in ["Source:", "References:", "Reference:"]:
+            for heading in SOURCE_HEADINGS[1:]:
                 if heading in response:
                     parts = response.split(heading, 1)
                     break
@@ -58,31 +100,10 @@ def parse_llm_response(response):
 
         if len(parts) > 1:
             sources_text = parts[1].strip()
-            source_lines = sources_text.split("\n")
-            for line in source_lines:
-                line = line.strip()
-                if not line:
-                    continue
-                # Remove list markers
-                line = re.sub(r'^\d+\.\s*', '', line)
-                line = re.sub(r'^-\s*', '', line)
-                # Extract URL and text
-                url_match = re.search(
-                    r'URL:\s*\[(.*?)\]|url:\s*\[(.*?)\]|\[(http[^\]]+)\]|URL:\s*(http\S+)|url:\s*(http\S+)|(http\S+)',
-                    line, re.IGNORECASE)
-                text_match = re.search(
-                    r'Text:\s*\[(.*?)\]|text:\s*\[(.*?)\]|"(.*?)"|Text:\s*"(.*?)"|text:\s*"(.*?)"',
-                    line, re.IGNORECASE)
-                if url_match:
-                    url = next((g for g in url_match.groups() if g), "")
-                    url = url.strip()
-                    text = "Source reference"
-                    if text_match:
-                        text_value = next((g for g in text_match.groups() if g), "")
-                        if text_value:
-                            text = text_value.strip()
-                    if url and url.startswith("http"):
-                        links.append({"url": url, "text": text})
+            for line in sources_text.split("\n"):
+                link = parse_source_line(line)
+                if link:
+                    links.append(link)
 
         return {
             "answer": answer,
@@ -93,3 +114,73 @@ def parse_llm_response(response):
             "answer": "Error parsing the response from the language model.",
             "links": []
         }
+
+
+class StreamingAnswerParser:
+    """
+    Incremental counterpart of parse_llm_response for streamed completions.
+
+    feed() returns the answer text that is safe to forward (a possible partial heading
+    and trailing whitespace are held back). Once "Sources:" shows up, the rest is parsed
+    line by line into links. Like parse_llm_response, the other headings only count when
+    "Sources:" never appears, so text from the first of them on is held until finish().
+    """
+    HOLD_BACK = max(len(heading) for heading in SOURCE_HEADINGS) - 1
+
+    def __init__(self):
+        self.buffer = ""
+        self.pending_space = ""
+        self.started = False
+        self.in_sources = False
+        self.answer = ""
+        self.links = []
+
+    def _emit(self, text, final=False):
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        text = self.pending_space + text
+        stripped = text.rstrip()
+        self.pending_space = "" if final else text[len(stripped):]
+        self.answer += stripped
+        return stripped
+
+    def _feed_sources(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            link = parse_source_line(line)
+            if link:
+                self.links.append(link)
+
+    def feed(self, delta):
+        if self.in_sources:
+            self._feed_sources(delta)
+            return ""
+        self.buffer += delta
+        pos = self.buffer.find(SOURCE_HEADINGS[0])
+        if pos >= 0:
+            answer_part, rest = self.buffer[:pos], self.buffer[pos + len(SOURCE_HEADINGS[0]):]
+            self.in_sources = True
+            self.buffer = ""
+            self._feed_sources(rest)
+            return self._emit(answer_part, final=True)
+        found = [self.buffer.find(h) for h in SOURCE_HEADINGS[1:] if h in self.buffer]
+        safe = min([len(self.buffer) - self.HOLD_BACK, *found])
+        if safe <= 0:
+            return ""
+        text, self.buffer = self.buffer[:safe], self.buffer[safe:]
+        return self._emit(text)
+
+    def finish(self):
+        """Return (remaining answer text, links)."""
+        if self.in_sources:
+            self._feed_sources("\n")
+            return "", self.links
+        text, self.buffer = self.buffer, ""
+        for heading in SOURCE_HEADINGS[1:]:
+            if heading in text:
+                answer_part, rest = text.split(heading, 1)
+                self._feed_sources(rest + "\n")
+                return self._emit(answer_part, final=True), self.links
+        return self._emit(text, final=True), self.links
@@ -1,9 +1,10 @@
 import time
-import requests
+import asyncio
 import base64
 import re
 import json, os
 import ast
+from pathlib import Path
 import numpy as np
 
 
@@ -36,6 +37,50 @@ class RateLimiter:
         self.last_request_time = curr_time
 
 
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) for rate limiting and budgets."""
+    return len(text) // 4 + 1
+
+
+class AsyncRateLimiter:
+    """
+    Token buckets for requests/minute and tokens/minute.
+
+    `await acquire(tokens)` sleeps with asyncio until both buckets can cover the call,
+    so waiting never blocks the event loop. Waiters are served in arrival order.
+    """
+    def __init__(self, requests_per_minute: int = 3000, tokens_per_minute: int = 1_000_000):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.request_allowance = float(requests_per_minute)
+        self.token_allowance = float(tokens_per_minute)
+        self.last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.request_allowance = min(self.requests_per_minute,
+                                     self.request_allowance + elapsed * self.requests_per_minute / 60)
+        self.token_allowance = min(self.tokens_per_minute,
+                                   self.token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    async def acquire(self, tokens: int = 1):
+        # A single call larger than the whole bucket would wait forever; cap it
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.request_allowance >= 1 and self.token_allowance >= tokens:
+                    self.request_allowance -= 1
+                    self.token_allowance -= tokens
+                    return
+                request_wait = (1 - self.request_allowance) * 60 / self.requests_per_minute
+                token_wait = (tokens - self.token_allowance) * 60 / self.tokens_per_minute
+                await asyncio.sleep(max(request_wait, token_wait, 0.001))
+
+
 def image_url_to_base64(image_url, format_hint=None):
     if image_url.startswith("file://"):
         # Local file path
@@ -61,6 +106,9 @@ def image_url_to_base64(image_url, format_hint=None):
             ),
             "Referer": "https://europe1.discourse-cdn.com/"
         }
+        # Nothing in the app or ingestion calls this synchronous path any more (only notebook/test.ipynb
+        # does); import requests here so serving never loads it
+        import requests
         try:
             response = requests.get(image_url, headers=headers)
             response.raise_for_status()
@@ -73,6 +121,47 @@ def image_url_to_base64(image_url, format_hint=None):
         except Exception as e:
             print(f"Other error for {image_url}: {e}")
             return None
+async def fetch_image_base64(image_url, client):
+    """
+    Async counterpart of image_url_to_base64 using the shared httpx client. Images over
+    IMAGE_MAX_BYTES are refused (None) without reading or downloading more than the limit.
+    """
+    # image_prep reads config; importing it here keeps `import helper` (index_store,
+    # benchmarks) from freezing the environment before callers have set it up
+    from image_prep import check_image_size
+    if image_url.startswith("file://"):
+        file_path = image_url[7:]  # Remove 'file://'
+        try:
+            check_image_size(os.path.getsize(file_path))
+            img_bytes = await asyncio.to_thread(Path(file_path).read_bytes)
+            return base64.b64encode(img_bytes).decode()
+        except Exception as e:
+            print(f"Error reading file {file_path}: {e}")
+            return None
+    headers = {
+        "User-Agent": (
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+            "AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/129.0.0.0 Safari/537.36"
+        ),
+        "Referer": "https://europe1.discourse-cdn.com/"
+    }
+    try:
+        async with client.stream("GET", image_url, headers=headers, follow_redirects=True) as response:
+            response.raise_for_status()
+            length = response.headers.get("Content-Length", "")
+            if length.isdigit():
+                check_image_size(int(length))
+            # Content-Length can be missing or wrong; stop reading as soon as the limit is passed
+            img_bytes = bytearray()
+            async for chunk in response.aiter_bytes():
+                img_bytes += chunk
+                check_image_size(len(img_bytes))
+        return base64.b64encode(img_bytes).decode()
+    except Exception as e:
+        print(f"Error fetching image {image_url}: {e}")
+        return None
+
 def extract_europe1_urls(text):
     # Regex pattern to find URLs starting with 'https://europe1'
     pattern = r'https://europe1[^"\s]+'
@@ -85,7 +174,8 @@ def read_json_file(file):
     
 def load_embeddings(file_path):
     try:
-        return np.load(file_path)
+        # legacy files produced from nested Python lists can contain object arrays
+        return np.load(file_path, allow_pickle=True)
     except Exception as e:
         print(e)
 
@@ -0,0 +1,44 @@
+"""
+One long-lived, connection-pooled httpx.AsyncClient for every upstream model call.
+
+app.py creates it in its lifespan handler and passes it to each call; scripts that
+don't pass a client share the lazily created module-level one via get_client().
+"""
+import importlib.util
+
+import httpx
+
+from config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP2_ENABLED
+
+# Per-endpoint timeouts, passed on each request
+EMBEDDINGS_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+CHAT_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+VISION_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+_client = None
+
+
+def create_client():
+    # HTTP/2 needs the optional h2 package (pip install httpx[http2])
+    http2 = HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(limits=limits, http2=http2, timeout=EMBEDDINGS_TIMEOUT)
+
+
+def get_client():
+    """The shared module-level client, created on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
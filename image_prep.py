@@ -0,0 +1,154 @@
+"""
+Image pre-processing before the vision (OCR) call.
+
+Screenshots and phone photos are downsampled to what the vision model actually looks at,
+converted to grayscale when they have no real colour, and re-encoded as JPEG only when
+they are photographic (text-heavy screenshots stay PNG, where JPEG artifacts would hurt
+OCR). Oversize payloads are rejected before anything is decoded or uploaded.
+
+Pillow is optional: without it images are only size-checked and sent as they are. It is
+imported on the first image rather than at startup, which most requests never need.
+"""
+import io
+import threading
+
+from config import IMAGE_MAX_BYTES, IMAGE_MAX_DIMENSION, IMAGE_MAX_SHORT_SIDE, IMAGE_JPEG_QUALITY
+
+Image = ImageChops = ImageOps = None
+_pillow_checked = False
+# prepare_image runs in worker threads; the first images can arrive together
+_pillow_lock = threading.Lock()
+
+# Largest per-channel spread (0-255) for which an RGB image is treated as grayscale
+GRAYSCALE_TOLERANCE = 8
+# Images with more distinct colours than this (after downsampling) are photographic
+PHOTO_MIN_COLORS = 16384
+
+# Running totals for this process, e.g. for logging what pre-processing saves
+image_stats = {"images": 0, "rejected": 0, "original_bytes": 0, "sent_bytes": 0}
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def _load_pillow():
+    """Import Pillow on first use; False when it isn't installed."""
+    global Image, ImageChops, ImageOps, _pillow_checked
+    if not _pillow_checked:
+        with _pillow_lock:
+            if not _pillow_checked:
+                try:
+                    from PIL import Image, ImageChops, ImageOps
+                except ImportError:
+                    pass
+                # Only once the import has finished, so no other thread sees Image still unset
+                _pillow_checked = True
+    return Image is not None
+
+
+def check_image_size(num_bytes):
+    if num_bytes > IMAGE_MAX_BYTES:
+        image_stats["rejected"] += 1
+        raise ImageTooLarge(f"Image is {num_bytes / 2**20:.1f} MB; the limit is {IMAGE_MAX_BYTES / 2**20:.1f} MB")
+
+
+def check_base64_size(base64_image):
+    """Reject an oversize base64 payload before decoding it."""
+    check_image_size(len(base64_image) * 3 // 4)
+
+
+def sniff_mime_type(image_bytes):
+    if image_bytes.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if image_bytes.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
+
+
+def target_size(width, height):
+    """Downscaled (width, height): longest side <= IMAGE_MAX_DIMENSION, shortest <= IMAGE_MAX_SHORT_SIDE."""
+    scale = min(1.0, IMAGE_MAX_DIMENSION / max(width, height), IMAGE_MAX_SHORT_SIDE / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _is_grayscale(img):
+    if img.mode in ("L", "LA", "1"):
+        return True
+    rgb = img.convert("RGB")
+    rgb.thumbnail((256, 256))
+    r, g, b = rgb.split()
+    # Largest per-pixel difference between channels
+    spread = ImageChops.lighter(ImageChops.difference(r, g), ImageChops.difference(g, b))
+    return spread.getextrema()[1] <= GRAYSCALE_TOLERANCE
+
+
+def _flatten(img):
+    """RGB or L copy of the image; transparency is composited onto white."""
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, img).convert("RGB")
+    return img if img.mode in ("RGB", "L") else img.convert("RGB")
+
+
+def _reencode(image_bytes):
+    """
+    (original size, bytes to send, mime type, sent size). The original bytes are kept
+    unless the re-encoded image is smaller or had to be downscaled.
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    source_format = img.format
+    img = ImageOps.exif_transpose(img)
+    original_size = img.size
+    size = target_size(*img.size)
+    resized = size != img.size
+    img = _flatten(img)
+    if resized:
+        img = img.resize(size, Image.LANCZOS)
+    img = img.convert("L") if _is_grayscale(img) else img.convert("RGB")
+
+    out = io.BytesIO()
+    photographic = source_format == "JPEG" or img.getcolors(PHOTO_MIN_COLORS) is None
+    if photographic:
+        img.save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    else:
+        img.save(out, format="PNG", optimize=True)
+
+    if resized or out.tell() < len(image_bytes):
+        return original_size, out.getvalue(), "image/jpeg" if photographic else "image/png", img.size
+    return original_size, image_bytes, sniff_mime_type(image_bytes), original_size
+
+
+def prepare_image(image_bytes):
+    """
+    Returns (bytes to send, mime type, info) where info records the original and sent
+    byte sizes and pixel dimensions. Raises ImageTooLarge for payloads over IMAGE_MAX_BYTES.
+    """
+    check_image_size(len(image_bytes))
+    info = {"original_bytes": len(image_bytes), "sent_bytes": len(image_bytes),
+            "original_size": None, "sent_size": None}
+    mime_type = sniff_mime_type(image_bytes)
+
+    if _load_pillow():
+        try:
+            reencoded = _reencode(image_bytes)
+        except Image.DecompressionBombError as e:
+            image_stats["rejected"] += 1
+            raise ImageTooLarge(str(e))
+        except Exception:
+            # Not something Pillow can read (or truncated/corrupt, which only shows once the
+            # pixels are decoded); let the vision model try the original
+            reencoded = None
+
+        if reencoded is not None:
+            info["original_size"], image_bytes, mime_type, info["sent_size"] = reencoded
+
+    info["mime_type"] = mime_type
+    info["sent_bytes"] = len(image_bytes)
+    image_stats["images"] += 1
+    image_stats["original_bytes"] += info["original_bytes"]
+    image_stats["sent_bytes"] += info["sent_bytes"]
+    return image_bytes, mime_type, info
@@ -0,0 +1,259 @@
+"""
+On-disk search index, one directory per source:
+
+    meta.json          count, dim, dtype, source
+    embeddings.npy     L2-normalized float32/float16 matrix, opened with mmap_mode='r'
+    chunks.bin         every chunk as one concatenated UTF-8 blob
+    chunk_offsets.npy  int64 byte offsets into chunks.bin (count + 1 entries)
+    url_ids.npy        int32 row -> position in urls.json
+    urls.json          interned URL table
+    keys.npy           per-row chunk key (checkpoint.chunk_key), used to patch the index
+    codes_int8.npy     int8 codes + int8_scales.npy, 1-bit codes_binary.npy, or the first 256 / 512
+                       dimensions re-normalized (prefix_256.npy / prefix_512.npy, float32); only
+                       the one saved for that quantization (see quantize.py)
+    ivf.npz, bm25.npz  optional IVF (ann.py) and BM25 (lexical.py) indexes built after saving
+
+Nothing but meta.json and urls.json is read eagerly: embedding pages are faulted in by
+the first search and chunk text is only decoded for the rows that are returned.
+
+Convert the legacy .npz files with:
+    python index_store.py embeddings/discourse_embeddings.npz embeddings/discourse_index --source discourse
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+from ann import IVF_FILE, IVFIndex, build_ivf
+from lexical import BM25_FILE, BM25Index, build_bm25
+from quantize import (QUANTIZATIONS, BinaryCodes, Float16Codes, Int8Codes, PrefixCodes,
+                      quantize_binary, quantize_int8, truncate)
+from checkpoint import chunk_key
+from helper import load_embeddings
+from search import VectorIndex, normalize_rows
+
+INDEX_DTYPES = ("float32", "float16")
+
+
+class ChunkStore:
+    """Lazily decoded chunk texts backed by a memory-mapped UTF-8 blob."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+
+class UrlTable:
+    """Row -> URL lookup over an interned URL list."""
+
+    def __init__(self, url_ids, urls):
+        self.url_ids = url_ids
+        self.urls = urls
+
+    def __len__(self):
+        return len(self.url_ids)
+
+    def __getitem__(self, i):
+        return self.urls[self.url_ids[i]]
+
+
+def save_index(index_dir, chunks, embeddings, urls, source, dtype="float32", quantization="none"):
+    """
+    Write chunks/embeddings/urls (flat, equal-length sequences) as an index directory.
+    Precomputed codes are only written for quantization (int8, binary or a prefix);
+    load_index computes any others it is asked for.
+
+    Files are written to a sibling temporary directory that then replaces index_dir, so a
+    process that has the old index memory-mapped keeps reading consistent data.
+    """
+    if dtype not in INDEX_DTYPES:
+        raise ValueError(f"dtype must be one of {INDEX_DTYPES}, got {dtype!r}")
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"quantization must be one of {QUANTIZATIONS}, got {quantization!r}")
+    index_dir = os.path.normpath(index_dir)
+    tmp_dir = index_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    matrix = np.array(embeddings, dtype=np.float32)
+    matrix = matrix.reshape(len(chunks), -1) if len(chunks) else np.zeros((0, 0), dtype=np.float32)
+    matrix = normalize_rows(np.ascontiguousarray(matrix))
+    np.save(os.path.join(tmp_dir, "embeddings.npy"), matrix.astype(dtype))
+    if quantization == "int8":
+        codes, scales = quantize_int8(matrix)
+        np.save(os.path.join(tmp_dir, "codes_int8.npy"), codes)
+        np.save(os.path.join(tmp_dir, "int8_scales.npy"), scales)
+    elif quantization == "binary":
+        np.save(os.path.join(tmp_dir, "codes_binary.npy"), quantize_binary(matrix))
+    elif quantization.startswith("prefix"):
+        dims = int(quantization[len("prefix"):])
+        if matrix.shape[1] > dims:
+            np.save(os.path.join(tmp_dir, f"prefix_{dims}.npy"), truncate(matrix, dims))
+
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    with open(os.path.join(tmp_dir, "chunks.bin"), "wb") as f:
+        for i, chunk in enumerate(chunks):
+            encoded = str(chunk).encode("utf-8")
+            f.write(encoded)
+            offsets[i + 1] = offsets[i] + len(encoded)
+    np.save(os.path.join(tmp_dir, "chunk_offsets.npy"), offsets)
+
+    url_table = {}
+    url_ids = np.array([url_table.setdefault(str(url), len(url_table)) for url in urls], dtype=np.int32)
+    np.save(os.path.join(tmp_dir, "url_ids.npy"), url_ids)
+    with open(os.path.join(tmp_dir, "urls.json"), "w", encoding="utf-8") as f:
+        json.dump(list(url_table), f, ensure_ascii=False)
+
+    keys = np.array([chunk_key(str(url), str(chunk)) for chunk, url in zip(chunks, urls)], dtype="S64")
+    np.save(os.path.join(tmp_dir, "keys.npy"), keys)
+
+    # meta.json goes last so a half-written directory is never picked up as an index
+    meta = {"count": len(chunks), "dim": int(matrix.shape[1]) if len(chunks) else 0,
+            "dtype": dtype, "source": source}
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    old_dir = index_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.rename(index_dir, old_dir)
+    os.rename(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def patch_index(index_dir, remove_keys, chunks, embeddings, urls, source, quantization="none"):
+    """
+    Drop the rows whose chunk key is in remove_keys and append new rows, without touching
+    (or re-embedding) anything else. The index must exist: rows that aren't being replaced
+    can't be recovered from the new ones (see ingest.load_manifest).
+    """
+    if not os.path.exists(os.path.join(index_dir, "meta.json")):
+        raise FileNotFoundError(f"No index to patch in {index_dir}")
+
+    dtype = load_meta(index_dir)["dtype"]
+    old = load_index(index_dir)
+    old_keys = np.load(os.path.join(index_dir, "keys.npy"))
+    keep = np.flatnonzero(~np.isin(old_keys, np.array(list(remove_keys), dtype="S64")))
+    print(f"🩹 Patching {index_dir}: keeping {len(keep)} of {len(old)} rows, adding {len(chunks)}")
+
+    dim = old.matrix.shape[1]
+    matrix = np.concatenate([
+        np.asarray(old.matrix[keep], dtype=np.float32),
+        np.array(embeddings, dtype=np.float32).reshape(len(chunks), dim),
+    ])
+    save_index(index_dir,
+               [old.chunk(i) for i in keep] + list(chunks),
+               matrix,
+               [old.url(i) for i in keep] + list(urls),
+               source, dtype, quantization)
+
+
+def load_meta(index_dir):
+    with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_codes(index_dir, matrix, quantization):
+    """Resident quantize.py codes for an index directory, computed if it wasn't saved with them."""
+    if quantization == "float16":
+        return Float16Codes.from_matrix(matrix)
+    if quantization == "int8":
+        codes_path = os.path.join(index_dir, "codes_int8.npy")
+        if os.path.exists(codes_path):
+            return Int8Codes(np.load(codes_path), np.load(os.path.join(index_dir, "int8_scales.npy")))
+        return Int8Codes.from_matrix(matrix)
+    if quantization == "binary":
+        codes_path = os.path.join(index_dir, "codes_binary.npy")
+        if os.path.exists(codes_path):
+            return BinaryCodes(np.load(codes_path))
+        return BinaryCodes.from_matrix(matrix)
+    if quantization.startswith("prefix") and quantization in QUANTIZATIONS:
+        dims = int(quantization[len("prefix"):])
+        prefix_path = os.path.join(index_dir, f"prefix_{dims}.npy")
+        if os.path.exists(prefix_path):
+            return PrefixCodes(np.load(prefix_path))
+        return PrefixCodes.from_matrix(matrix, dims)
+    raise ValueError(f"quantization must be one of {QUANTIZATIONS}, got {quantization!r}")
+
+
+def load_index(index_dir, search_mode="exact", nprobe=8, quantization="none", shortlist=200):
+    """
+    Open an index directory as a VectorIndex without reading the matrix or the chunk text.
+    search_mode="ivf" attaches the prebuilt ivf.npz (see ann.py) probing nprobe lists.
+    bm25.npz (see lexical.py) is attached whenever it exists. quantization other than
+    "none" keeps only compact codes in memory and rescores a shortlist of rows exactly.
+    """
+    meta = load_meta(index_dir)
+    matrix = np.load(os.path.join(index_dir, "embeddings.npy"), mmap_mode="r")
+    offsets = np.load(os.path.join(index_dir, "chunk_offsets.npy"), mmap_mode="r")
+    url_ids = np.load(os.path.join(index_dir, "url_ids.npy"), mmap_mode="r")
+    with open(os.path.join(index_dir, "urls.json"), "r", encoding="utf-8") as f:
+        urls = json.load(f)
+
+    blob_path = os.path.join(index_dir, "chunks.bin")
+    # np.memmap refuses zero-length files
+    blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else b""
+
+    index = VectorIndex(matrix, ChunkStore(blob, offsets), UrlTable(url_ids, urls), meta["source"])
+    bm25_path = os.path.join(index_dir, BM25_FILE)
+    if os.path.exists(bm25_path):
+        index.lexical = BM25Index.load(bm25_path)
+    if search_mode == "ivf":
+        ivf_path = os.path.join(index_dir, IVF_FILE)
+        if os.path.exists(ivf_path):
+            index.ann = IVFIndex.load(ivf_path, nprobe)
+        else:
+            print(f"⚠️ {ivf_path} not found, using exact search for {meta['source']}")
+    elif search_mode != "exact":
+        raise ValueError(f"unknown search mode {search_mode!r}")
+    if quantization != "none" and len(matrix):
+        index.codes = load_codes(index_dir, matrix, quantization)
+        index.shortlist = shortlist
+    return index
+
+
+def _flatten_strings(values):
+    flat = []
+    for value in values.tolist():
+        while isinstance(value, (list, tuple)):
+            value = value[0] if value else ""
+        flat.append(str(value))
+    return flat
+
+
+def convert_npz(npz_path, index_dir, source, dtype="float32", quantization="none", nlist=0):
+    """
+    Convert a legacy np.savez file ([[chunk]], [[embedding]], [[url]]) into an index
+    directory, with the IVF and BM25 indexes ingestion builds alongside it.
+    """
+    data = load_embeddings(npz_path)
+    chunks = _flatten_strings(data["chunks"])
+    urls = _flatten_strings(data["original_urls"])
+    # tolist() also unwraps object arrays of nested Python lists
+    embeddings = np.array(data["embeddings"].tolist(), dtype=np.float32).reshape(len(chunks), -1)
+    save_index(index_dir, chunks, embeddings, urls, source, dtype, quantization)
+    print(f"✅ Converted {len(chunks)} chunks from {npz_path} to {index_dir} ({dtype})")
+    build_ivf(index_dir, nlist)
+    build_bm25(index_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a legacy embeddings .npz into an index directory")
+    parser.add_argument("npz_path")
+    parser.add_argument("index_dir")
+    parser.add_argument("--source", required=True, choices=["discourse", "markdown"])
+    parser.add_argument("--dtype", default="float32", choices=INDEX_DTYPES)
+    parser.add_argument("--quantization", default="none", choices=QUANTIZATIONS,
+                        help="precompute the codes for this QUANTIZATION setting")
+    parser.add_argument("--nlist", type=int, default=0, help="IVF lists (0 = ~4*sqrt(N), as IVF_NLIST)")
+    args = parser.parse_args()
+    convert_npz(args.npz_path, args.index_dir, args.source, args.dtype, args.quantization, args.nlist)
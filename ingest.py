@@ -0,0 +1,152 @@
+"""
+Second half of the ingestion scripts (main.py, main_discourse.py): embed the chunks of
+new and changed files and patch them into the search index.
+
+Progress goes to an append-only checkpoint log, so an interrupted run resumes by chunk
+hash instead of by position. The manifest (manifest.py) records which chunks each raw
+file produced, so only added/changed/deleted files touch the index.
+"""
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+from ann import IVF_FILE, build_ivf
+from cache import EmbeddingCache
+from checkpoint import CheckpointLog, chunk_key
+from config import OPEN_API_KEY, IVF_NLIST, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, QUANTIZATION
+from embed import iter_embedding_batches
+from index_store import load_meta, patch_index, save_index
+from lexical import build_bm25
+from manifest import Manifest
+
+
+def load_manifest(source):
+    """
+    The ingestion manifest for source, or an empty one when embeddings/<source>_index is
+    missing or doesn't hold the rows the manifest lists. Patching such an index would drop
+    the rows of every unchanged file for good; with an empty manifest every file counts as
+    added and the index is rebuilt.
+    """
+    manifest = Manifest.load(source)
+    if not manifest.files:
+        return manifest
+    index_dir = f"embeddings/{source}_index"
+    expected = len(manifest.chunk_ids(manifest.files))
+    rows = load_meta(index_dir)["count"] if os.path.exists(os.path.join(index_dir, "meta.json")) else None
+    if rows != expected:
+        found = "is missing" if rows is None else f"has {rows} rows"
+        print(f"⚠️ {index_dir} {found} but the manifest lists {expected}; rebuilding it from scratch")
+        return Manifest(manifest.path)
+    return manifest
+
+
+async def embed_items(items, checkpoint):
+    """
+    Embed (key, url, chunk, file_path) items that the checkpoint doesn't have yet.
+    Returns ({key: record} for every embedded item, number of failed chunks).
+    """
+    print(f"📂 Loading checkpoint {checkpoint.path}...")
+    done = checkpoint.load()
+
+    pending = []
+    queued = set()
+    for item in items:
+        if item[0] not in done and item[0] not in queued:
+            queued.add(item[0])
+            pending.append(item)
+    print(f"✅ {len(items) - len(pending)} of {len(items)} chunks already embedded, {len(pending)} to go")
+
+    # Chunks embedded by an earlier run (same text and model) are served from the cache
+    cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+    failed = 0
+    with tqdm(total=len(items), initial=len(items) - len(pending), desc="Processing Chunks") as pbar:
+        # Up to INGEST_CONCURRENCY batches are in flight; results arrive in input order
+        batches = iter_embedding_batches([chunk for _, _, chunk, _ in pending], OPEN_API_KEY, cache=cache)
+        async for start, end, embeddings, error in batches:
+            batch = pending[start:end]
+            if error:
+                failed += len(batch)
+                print(f"❌ Error getting embeddings for batch ending in {batch[-1][3]}: {error}")
+            else:
+                records = [
+                    {"key": key, "url": url, "chunk": chunk, "embedding": embedding}
+                    for (key, url, chunk, _), embedding in zip(batch, embeddings)
+                ]
+                checkpoint.append(records)
+                done.update((record["key"], record) for record in records)
+                pbar.set_postfix({"file": batch[-1][3].name})
+            pbar.update(len(batch))
+    checkpoint.close()
+
+    print(f"📦 Embedding cache: {cache.stats()}")
+    cache.close()
+    return done, failed
+
+
+async def update_index(file_chunks, file_urls, source, manifest, changes, topic_ids=None):
+    """
+    file_chunks / file_urls: {file_path: [chunk, ...]} / {file_path: url} for the added and
+    changed files only. Rows of changed and deleted files are replaced in
+    embeddings/<source>_index; everything else in the index is left as it is.
+    """
+    index_dir = f"embeddings/{source}_index"
+    topic_ids = topic_ids or {}
+    checkpoint = CheckpointLog(f"embeddings/{source}_checkpoint.jsonl")
+
+    # (key, url, chunk, file_path) for every new chunk, in file order
+    items = []
+    for file_path, chunks in file_chunks.items():
+        url = file_urls[file_path]
+        items.extend((chunk_key(url, chunk), url, chunk, file_path) for chunk in chunks)
+
+    done, failed = await embed_items(items, checkpoint)
+
+    # A file is only applied once all of its chunks are embedded; otherwise its old rows
+    # (if any) stay and it is retried on the next run
+    complete = [
+        file_path for file_path, chunks in file_chunks.items()
+        if all(chunk_key(file_urls[file_path], chunk) in done for chunk in chunks)
+    ]
+    rows = [done[key] for key, _, _, file_path in items if key in done and file_path in complete]
+
+    # Without a manifest we don't know what an existing index holds: rebuild it, but only
+    # once every chunk is embedded so a partial run never replaces a complete index
+    if not manifest.files:
+        if failed:
+            print(f"⚠️ {failed} chunks failed to embed; re-run to finish building {index_dir}")
+            return
+        if os.path.exists(index_dir):
+            print(f"⚠️ No manifest for {source}, rebuilding {index_dir} from scratch")
+        save_index(index_dir,
+                   [row["chunk"] for row in rows],
+                   [row["embedding"] for row in rows],
+                   [row["url"] for row in rows],
+                   source=source, quantization=QUANTIZATION)
+        build_ivf(index_dir, IVF_NLIST)
+        build_bm25(index_dir)
+    else:
+        remove_keys = manifest.chunk_ids([*changes.deleted, *[p for p in changes.changed if p in complete]])
+        if rows or remove_keys:
+            # Re-use the existing coarse centroids; only the inverted lists change
+            ivf_path = os.path.join(index_dir, IVF_FILE)
+            centroids = np.load(ivf_path)["centroids"] if os.path.exists(ivf_path) else None
+            patch_index(index_dir, remove_keys,
+                        [row["chunk"] for row in rows],
+                        [row["embedding"] for row in rows],
+                        [row["url"] for row in rows],
+                        source=source, quantization=QUANTIZATION)
+            build_ivf(index_dir, IVF_NLIST, centroids)
+            build_bm25(index_dir)
+
+    for key in changes.deleted:
+        manifest.forget(key)
+    for file_path in complete:
+        manifest.record(file_path, [chunk_key(file_urls[file_path], chunk) for chunk in file_chunks[file_path]],
+                        topic_ids.get(file_path))
+    manifest.save()
+
+    if failed:
+        print(f"⚠️ {failed} chunks failed to embed; re-run to retry just those")
+    else:
+        checkpoint.clear()
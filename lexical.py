@@ -0,0 +1,111 @@
+"""
+BM25 inverted index over the chunks of an index directory.
+
+Gives retrieval that needs no embedding call: query terms are looked up in the postings
+and their precomputed BM25 weights summed per row. It backs the hybrid (dense +
+lexical) mode in get_answer and the lexical-only fallback used when the query embedding
+misses its deadline. Stored as bm25.npz inside the index directory:
+
+    python lexical.py embeddings/discourse_index
+"""
+import argparse
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+BM25_FILE = "bm25.npz"
+TOKEN = re.compile(r"[a-z0-9]+(?:[._'][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from how i if in is it of on or so that the "
+    "this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(str(text).lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, terms, term_offsets, doc_ids, weights, count):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms.tolist())}
+        self.term_offsets = term_offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def build(cls, chunks, k1=1.2, b=0.75):
+        """Postings for every term, each weighted with its BM25 term score for that row."""
+        vocabulary = {}
+        term_ids, doc_ids, tfs = [], [], []
+        lengths = np.zeros(len(chunks), dtype=np.float32)
+        for doc in range(len(chunks)):
+            tokens = tokenize(chunks[doc])
+            lengths[doc] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc)
+                tfs.append(tf)
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        doc_ids = np.array(doc_ids, dtype=np.int32)
+        tfs = np.array(tfs, dtype=np.float32)
+
+        # Group postings by term (CSR layout, like the IVF inverted lists)
+        order = np.argsort(term_ids, kind="stable")
+        df = np.bincount(term_ids, minlength=len(vocabulary))
+        term_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(df, out=term_offsets[1:])
+        doc_ids, tfs = doc_ids[order], tfs[order]
+
+        n = len(chunks)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = lengths.mean() if n and lengths.mean() > 0 else 1.0
+        norm = k1 * (1 - b + b * lengths[doc_ids] / avgdl)
+        weights = np.repeat(idf, df) * tfs * (k1 + 1) / (tfs + norm)
+
+        terms = np.array(list(vocabulary), dtype=str)
+        return cls(terms, term_offsets, doc_ids, weights.astype(np.float32), n)
+
+    def scores(self, terms):
+        """BM25 score of every row for the given query terms (0 for rows matching none)."""
+        out = np.zeros(self.count, dtype=np.float32)
+        for term in set(terms):
+            i = self.term_ids.get(term)
+            if i is not None:
+                start, end = self.term_offsets[i], self.term_offsets[i + 1]
+                # A row appears at most once per term, so fancy-index += is safe
+                out[self.doc_ids[start:end]] += self.weights[start:end]
+        return out
+
+    def save(self, path):
+        np.savez(path, terms=self.terms, term_offsets=self.term_offsets, doc_ids=self.doc_ids,
+                 weights=self.weights, count=np.int64(self.count))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data["terms"], data["term_offsets"], data["doc_ids"], data["weights"], int(data["count"]))
+
+
+def build_bm25(index_dir):
+    """Build and persist bm25.npz from the chunk texts of an index directory."""
+    from index_store import load_index
+    index = load_index(index_dir)
+    bm25 = BM25Index.build(index.chunks)
+    bm25.save(os.path.join(index_dir, BM25_FILE))
+    print(f"✅ Built BM25 index with {len(bm25.terms)} terms for {len(bm25)} rows in {index_dir}")
+    return bm25
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a BM25 index for an index directory")
+    parser.add_argument("index_dir")
+    args = parser.parse_args()
+    build_bm25(args.index_dir)
@@ -0,0 +1,66 @@
+"""
+Per-source ingestion manifest (embeddings/<source>_manifest.json).
+
+For every raw file it records the content hash, topic id (Discourse) and the chunk
+keys that file contributed to the index. Comparing it with the files on disk tells the
+ingestion scripts which files were added, changed or deleted since the last run.
+"""
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+Changes = namedtuple("Changes", ["added", "changed", "deleted", "unchanged"])
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class Manifest:
+    def __init__(self, path, files=None):
+        self.path = path
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, source):
+        path = f"embeddings/{source}_manifest.json"
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(path, json.load(f)["files"])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def diff(self, paths):
+        """Compare files on disk with the manifest; returns Changes of paths (deleted as stored keys)."""
+        added, changed, unchanged = [], [], []
+        seen = set()
+        for path in paths:
+            key = str(path)
+            seen.add(key)
+            entry = self.files.get(key)
+            if entry is None:
+                added.append(path)
+            elif entry["hash"] != file_hash(path):
+                changed.append(path)
+            else:
+                unchanged.append(path)
+        deleted = [key for key in self.files if key not in seen]
+        return Changes(added, changed, deleted, unchanged)
+
+    def chunk_ids(self, keys):
+        """All chunk keys recorded for the given file keys."""
+        return [chunk_id for key in keys for chunk_id in self.files.get(str(key), {}).get("chunk_ids", [])]
+
+    def record(self, path, chunk_ids, topic_id=None):
+        self.files[str(path)] = {"hash": file_hash(path), "topic_id": topic_id, "chunk_ids": chunk_ids}
+
+    def forget(self, key):
+        self.files.pop(str(key), None)
@@ -0,0 +1,165 @@
+"""
+Per-stage timing spans, Prometheus text-format metrics and the Server-Timing header.
+
+    with span("ocr"):
+        description = await describe_base64_image(...)
+
+records the stage duration in the STAGE_SECONDS histogram and in the timings of the
+request being served, which ServerTimingMiddleware sends back as
+`Server-Timing: ocr;dur=812.4, embedding;dur=95.1, ..., total;dur=1432.0`. Work done
+in a task shared by several requests (a query batch) is collected with
+collect_timings() and handed to each request with add_timings().
+
+No client library: Counter/Histogram keep plain Python numbers and render() writes the
+text exposition format served on /metrics.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stage -> seconds for the request being served; None outside a request
+_timings = ContextVar("timings", default=None)
+
+
+def _labels(label_names, values):
+    if not label_names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(label_names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [per-bucket counts..., +Inf count], sum
+
+    def observe(self, seconds, *labels):
+        counts, total = self.series.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+        counts[bisect_left(self.buckets, seconds)] += 1
+        self.series[labels] = (counts, total + seconds)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = _labels((*self.label_names, "le"), (*labels, bound))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+def sample_lines(name, help_text, samples, label_names=(), metric_type="gauge"):
+    """Text-format lines for values kept elsewhere (cache stats etc.), from {label values: value}."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in sorted(samples.items()):
+        lines.append(f"{name}{_labels(label_names, labels)} {value}")
+    return lines
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Duration of one pipeline stage", labels=("stage",))
+REQUEST_SECONDS = Histogram("rag_request_seconds", "Duration of an HTTP request", labels=("path", "status"))
+UPSTREAM_RETRIES = Counter("rag_upstream_retries_total", "Upstream calls retried after an error",
+                           labels=("endpoint", "reason"))
+UPSTREAM_FAILURES = Counter("rag_upstream_failures_total", "Upstream calls that failed after all retries",
+                            labels=("endpoint",))
+LEXICAL_FALLBACKS = Counter("rag_lexical_fallbacks_total",
+                            "Queries answered from BM25 because the query embedding was unavailable")
+METRICS = [STAGE_SECONDS, REQUEST_SECONDS, UPSTREAM_RETRIES, UPSTREAM_FAILURES, LEXICAL_FALLBACKS]
+
+
+def add_timings(timings):
+    """Add stage durations to the current request's Server-Timing (no histogram update)."""
+    current = _timings.get()
+    if current is not None:
+        for stage, seconds in timings.items():
+            current[stage] = current.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage)
+        add_timings({stage: seconds})
+
+
+@contextmanager
+def collect_timings():
+    """Collect the spans inside the block into a fresh dict instead of the current request's."""
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def server_timing(timings, total):
+    metrics = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    return ", ".join([*metrics, f"total;dur={total * 1000:.1f}"])
+
+
+def render(extra_lines=()):
+    lines = [line for metric in METRICS for line in metric.render()]
+    return "\n".join([*lines, *extra_lines]) + "\n"
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware: per-request span collection, Server-Timing header, request histogram."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timings = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                # Streaming responses start before their stages run; they only get what's done so far
+                header = server_timing(timings, time.perf_counter() - start)
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"server-timing", header.encode("ascii"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            # Unknown paths (scanners) share one series
+            path = scope["path"] if status[0] != 404 else "other"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, path, status[0])
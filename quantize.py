@@ -0,0 +1,171 @@
+"""
+Compact in-memory codes for the first scoring pass over an index.
+
+A VectorIndex with .codes set scores every row (or every IVF-probed row) against its
+codes, keeps a shortlist of the best `shortlist` rows and rescores only those exactly
+against the full-precision, memory-mapped embeddings.npy. Only the codes have to stay
+resident; full-precision pages are faulted in for shortlisted rows only.
+
+    float16    2 bytes/dim   scores with float32 accumulation
+    int8       1 byte/dim    symmetric per-dimension scale
+    binary     1 bit/dim     sign bits, shortlisted by Hamming distance
+    prefix256  first 256 (or 512 for prefix512) dimensions, re-normalized; Matryoshka
+               embeddings such as text-embedding-3-* keep most of their ranking there
+
+int8, binary and prefix codes are written by index_store.save_index (codes_int8.npy +
+int8_scales.npy, codes_binary.npy, prefix_256.npy or prefix_512.npy) when the index is
+saved for that quantization; codes that weren't saved are computed at load.
+"""
+import numpy as np
+
+QUANTIZATIONS = ("none", "float16", "int8", "binary", "prefix256", "prefix512")
+BLOCK_ROWS = 65536
+# Rows upcast at a time when scoring; small enough for the float32 copy to stay in cache
+SCORE_BLOCK_ROWS = 256
+# Bits set per byte value, for numpy < 2.0 (no np.bitwise_count)
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount_rows(words):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+    return POPCOUNT[words.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+
+def quantize_int8(matrix):
+    """(codes, scales) with matrix ~= codes * scales; scales are per dimension."""
+    scales = np.zeros(matrix.shape[1], dtype=np.float32)
+    for start in range(0, len(matrix), BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + BLOCK_ROWS], dtype=np.float32)
+        np.maximum(scales, np.abs(block).max(axis=0), out=scales)
+    scales = scales / 127
+    scales[scales == 0] = 1.0
+    codes = np.empty(matrix.shape, dtype=np.int8)
+    for start in range(0, len(matrix), BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + BLOCK_ROWS], dtype=np.float32)
+        codes[start:start + len(block)] = np.clip(np.rint(block / scales), -127, 127)
+    return codes, scales
+
+
+def quantize_binary(matrix):
+    """Sign bits packed 8 per byte, rows padded to a multiple of 64 bits."""
+    words = (matrix.shape[1] + 63) // 64
+    codes = np.zeros((len(matrix), words * 8), dtype=np.uint8)
+    for start in range(0, len(matrix), BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + BLOCK_ROWS], dtype=np.float32)
+        packed = np.packbits(block > 0, axis=1)
+        codes[start:start + len(block), :packed.shape[1]] = packed
+    return codes
+
+
+def truncate(matrix, dims):
+    """First `dims` columns of every row, L2-normalized again."""
+    prefix = np.empty((len(matrix), min(dims, matrix.shape[1])), dtype=np.float32)
+    for start in range(0, len(matrix), BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + BLOCK_ROWS, :prefix.shape[1]], dtype=np.float32)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        prefix[start:start + len(block)] = block / norms
+    return prefix
+
+
+def _shortlist(scores, size, rows):
+    """The `size` highest-scoring positions, mapped through rows when given."""
+    if len(scores) > size:
+        best = np.argpartition(-scores, size - 1)[:size]
+    else:
+        best = np.arange(len(scores))
+    return rows[best] if rows is not None else best
+
+
+class Float16Codes:
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        return cls(np.asarray(matrix, dtype=np.float16))
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    def scores(self, query, rows=None):
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        out = np.empty(len(matrix), dtype=np.float32)
+        buffer = np.empty((SCORE_BLOCK_ROWS, matrix.shape[1]), dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+            block = matrix[start:start + SCORE_BLOCK_ROWS]
+            upcast = buffer[:len(block)]
+            upcast[...] = block
+            out[start:start + len(block)] = upcast @ query
+        return out
+
+    def shortlist(self, query, size, rows=None):
+        return _shortlist(self.scores(query, rows), size, rows)
+
+
+class Int8Codes(Float16Codes):
+    def __init__(self, codes, scales):
+        self.matrix = codes
+        self.scales = scales
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        return cls(*quantize_int8(matrix))
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + self.scales.nbytes
+
+    def scores(self, query, rows=None):
+        # Fold the per-dimension scales into the query once
+        return super().scores(query * self.scales, rows)
+
+
+class BinaryCodes:
+    def __init__(self, codes):
+        self.codes = codes
+        self.words = codes.view(np.uint64)
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        return cls(quantize_binary(matrix))
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def hamming(self, query, rows=None):
+        bits = np.zeros(self.codes.shape[1], dtype=np.uint8)
+        packed = np.packbits(np.asarray(query) > 0)
+        bits[:len(packed)] = packed
+        words = self.words if rows is None else self.words[rows]
+        distance = np.zeros(len(words), dtype=np.int32)
+        for start in range(0, len(words), BLOCK_ROWS):
+            block = words[start:start + BLOCK_ROWS]
+            distance[start:start + len(block)] = _popcount_rows(block ^ bits.view(np.uint64))
+        return distance
+
+    def shortlist(self, query, size, rows=None):
+        return _shortlist(-self.hamming(query, rows).astype(np.float32), size, rows)
+
+
+class PrefixCodes:
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    @classmethod
+    def from_matrix(cls, matrix, dims=256):
+        return cls(truncate(matrix, dims))
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    def shortlist(self, query, size, rows=None):
+        prefix = np.asarray(query[:self.matrix.shape[1]], dtype=np.float32)
+        norm = np.linalg.norm(prefix)
+        prefix = prefix / norm if norm else prefix
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        return _shortlist(matrix @ prefix, size, rows)
@@ -0,0 +1,222 @@
+import numpy as np
+
+from metrics import span
+
+SCORE_BLOCK_ROWS = 65536
+
+
+def normalize_rows(matrix):
+    """L2-normalize every row of a 2-D float32 matrix in place."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def normalize_query(query_embedding):
+    query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(query)
+    return query / norm if norm else query
+
+
+class VectorIndex:
+    """
+    One searchable corpus (discourse or markdown).
+
+    Embeddings are normalized once into a contiguous float32 matrix so a query is
+    a single matrix-vector product instead of a Python loop of cosine_similarity calls.
+    """
+
+    def __init__(self, matrix, chunks, urls, source):
+        # matrix rows must already be L2-normalized (see from_embeddings)
+        self.matrix = matrix
+        self.chunks = chunks
+        self.urls = urls
+        self.source = source
+        # Optional approximate index (ann.IVFIndex); None means exact search
+        self.ann = None
+        # Optional BM25 index over the same rows (lexical.BM25Index)
+        self.lexical = None
+        # Optional compact codes (quantize.py) that shortlist rows for exact rescoring
+        self.codes = None
+        self.shortlist = 200
+
+    @classmethod
+    def from_embeddings(cls, embeddings, chunks, urls, source):
+        matrix = np.array(embeddings, dtype=np.float32)
+        matrix = np.ascontiguousarray(matrix.reshape(len(matrix), -1))
+        return cls(normalize_rows(matrix), chunks, urls, source)
+
+    @classmethod
+    def from_npz(cls, data, source):
+        """Build from the legacy np.savez output ([[chunk]], [[embedding]], [[url]])."""
+        chunks = np.asarray(data['chunks']).reshape(-1)
+        urls = np.asarray(data['original_urls']).reshape(-1)
+        return cls.from_embeddings(data['embeddings'], chunks, urls, source)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def scores(self, query):
+        """
+        Cosine similarity of a normalized query against every row. query may also be a
+        (dim, batch) matrix of queries, giving (rows, batch) scores.
+        """
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ query
+        # float16 storage: upcast block by block instead of copying the whole matrix
+        out = np.empty((len(self),) + query.shape[1:], dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            block = self.matrix[start:start + SCORE_BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32) @ query
+        return out
+
+    def score_rows(self, rows, query):
+        return np.asarray(self.matrix[rows], dtype=np.float32) @ query
+
+    def candidates(self, query):
+        """
+        (rows, scores) to rank for a query. rows is None when every row was scored,
+        otherwise the row ids the approximate index and/or the codes shortlist selected;
+        their scores are always exact.
+        """
+        rows = self.ann.probe(query) if self.ann is not None else None
+        if self.codes is not None:
+            rows = self.codes.shortlist(query, self.shortlist, rows)
+        if rows is not None:
+            return rows, self.score_rows(rows, query)
+        return None, self.scores(query)
+
+    def chunk(self, i):
+        return str(self.chunks[i]) if i < len(self.chunks) else ""
+
+    def url(self, i):
+        return str(self.urls[i]) if i < len(self.urls) else ""
+
+
+def search_indexes(query_embedding, indexes, k, threshold=0.5):
+    """
+    Top-k over several indexes at once.
+
+    Scores from every index are concatenated, the threshold is applied as a mask
+    and argpartition picks the k best. Returns (index, row, similarity) tuples sorted
+    by similarity, highest first.
+    """
+    indexes = [index for index in indexes if index is not None and len(index)]
+    if not indexes or k <= 0:
+        return []
+
+    query = normalize_query(query_embedding)
+    candidates = []
+    for index in indexes:
+        with span(f"{index.source}_search"):
+            candidates.append(index.candidates(query))
+    rows, scores = zip(*candidates)
+    offsets = np.cumsum([0] + [len(s) for s in scores])
+    scores = np.concatenate(scores)
+
+    return _hits(indexes, rows, offsets, scores, _top(scores, k, threshold))
+
+
+def search_indexes_batch(query_embeddings, indexes, k, threshold=0.5):
+    """
+    search_indexes for several queries at once; returns one hit list per query.
+
+    Exactly-searched indexes score the whole batch with one matrix-matrix product.
+    With an ANN or codes first pass the candidate rows differ per query, so each query
+    is searched on its own.
+    """
+    indexes = [index for index in indexes if index is not None and len(index)]
+    if not indexes or k <= 0:
+        return [[] for _ in query_embeddings]
+    if any(index.ann is not None or index.codes is not None for index in indexes):
+        return [search_indexes(query, indexes, k, threshold) for query in query_embeddings]
+
+    queries = np.stack([normalize_query(query) for query in query_embeddings], axis=1)
+    offsets = np.cumsum([0] + [len(index) for index in indexes])
+    # (batch, rows): one contiguous row of scores per query
+    scores = []
+    for index in indexes:
+        with span(f"{index.source}_search"):
+            scores.append(index.scores(queries))
+    scores = np.ascontiguousarray(np.concatenate(scores).T)
+    rows = [None] * len(indexes)
+    return [_hits(indexes, rows, offsets, query_scores, _top(query_scores, k, threshold))
+            for query_scores in scores]
+
+
+def _top(scores, k, minimum):
+    """Positions of the (at most) k highest scores >= minimum, highest first."""
+    candidates = np.flatnonzero(scores >= minimum)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def _hits(indexes, rows, offsets, scores, positions):
+    """(index, row, similarity) for positions in the concatenated scores of several indexes."""
+    owners = np.searchsorted(offsets, positions, side='right') - 1
+    hits = []
+    for owner, pos in zip(owners, positions):
+        row = int(pos - offsets[owner])
+        if rows[owner] is not None:
+            row = int(rows[owner][row])
+        hits.append((indexes[owner], row, float(scores[pos])))
+    return hits
+
+
+def _lexical_scores(indexes, terms):
+    """Per-index BM25 scores scaled by the best score over all indexes (so in [0, 1])."""
+    scores = []
+    for index in indexes:
+        with span(f"{index.source}_lexical_search"):
+            scores.append(index.lexical.scores(terms) if index.lexical is not None
+                          else np.zeros(len(index), np.float32))
+    best = max((float(s.max()) for s in scores if len(s)), default=0.0)
+    return [s / best for s in scores] if best > 0 else scores
+
+
+def lexical_search_indexes(terms, indexes, k):
+    """
+    Top-k by BM25 alone (no query embedding needed). Returns (index, row, score) like
+    search_indexes, with score the BM25 score relative to the best match.
+    """
+    indexes = [index for index in indexes if index is not None and len(index)]
+    if not indexes or k <= 0 or not terms:
+        return []
+    scores = _lexical_scores(indexes, terms)
+    offsets = np.cumsum([0] + [len(s) for s in scores])
+    scores = np.concatenate(scores)
+    hits = []
+    for pos in _top(scores, k, np.finfo(np.float32).tiny):
+        owner = int(np.searchsorted(offsets, pos, side='right') - 1)
+        hits.append((indexes[owner], int(pos - offsets[owner]), float(scores[pos])))
+    return hits
+
+
+def hybrid_search_indexes(query_embedding, terms, indexes, k, threshold=0.5, lexical_weight=0.3, pool=4):
+    """
+    Top-k by (1 - lexical_weight) * cosine + lexical_weight * relative BM25 score.
+
+    Candidates are the pool * k best rows of each index by either score; the fused score
+    is computed for their union and the threshold applied to it. 0 <= lexical_weight < 1.
+    """
+    indexes = [index for index in indexes if index is not None and len(index)]
+    if not indexes or k <= 0:
+        return []
+
+    query = normalize_query(query_embedding)
+    lexical = _lexical_scores(indexes, terms)
+    hits = []
+    for index, lexical_scores in zip(indexes, lexical):
+        with span(f"{index.source}_search"):
+            rows, dense = index.candidates(query)
+            # Rows below this cosine can't reach the threshold even with the best BM25 score
+            dense_top = _top(dense, pool * k, (threshold - lexical_weight) / (1 - lexical_weight))
+            dense_rows = rows[dense_top] if rows is not None else dense_top
+            lexical_rows = _top(lexical_scores, pool * k, np.finfo(np.float32).tiny)
+            union = np.union1d(dense_rows, lexical_rows).astype(np.int64)
+            fused = (1 - lexical_weight) * index.score_rows(union, query) + lexical_weight * lexical_scores[union]
+        hits.extend((index, int(row), float(score)) for row, score in zip(union, fused) if score >= threshold)
+    hits.sort(key=lambda hit: hit[2], reverse=True)
+    return hits[:k]
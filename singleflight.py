@@ -0,0 +1,57 @@
+"""
+Single-flight execution of identical in-flight requests.
+
+Callers of SingleFlight.do with the same key while a call is running share its result
+(or exception) instead of starting their own. The shared call runs as its own task:
+a caller that goes away (client disconnect, deadline) only stops waiting, and the call
+is cancelled once nobody is waiting for it any more.
+"""
+import asyncio
+import hashlib
+
+from cache import normalize_text
+
+
+def request_key(question, image_base64=None):
+    """Identity of a query: case- and whitespace-normalized question plus image hash."""
+    image_hash = hashlib.sha256(image_base64.encode("ascii", "replace")).hexdigest() if image_base64 else ""
+    return hashlib.sha256(f"{normalize_text(question).casefold()}\0{image_hash}".encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        # Callers that joined a call already in flight, for logging/metrics
+        self.shared = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key, fn):
+        """Result of fn() (a coroutine function), shared with concurrent callers of the same key."""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.shared += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # The last interested caller left; later callers start a fresh call
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
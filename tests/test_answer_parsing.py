@@ -0,0 +1,31 @@
+"""StreamingAnswerParser must agree with parse_llm_response however the completion is chunked."""
+import pytest
+
+from get_answer import StreamingAnswerParser, parse_llm_response
+
+RESPONSES = [
+    "Use Podman instead of Docker.\n\nSources:\n- URL: [https://example.com/a], Text: [Podman setup]\n",
+    "Answer mentions Source: inline then\nSources:\n- URL: [https://example.com/a], Text: [A]\n"
+    "2. https://example.com/b \"B\"",
+    "An answer with only a singular heading.\nSource:\n- https://example.com/a",
+    "Mentions Reference: early, then\nSource:\n- https://example.com/a\nReferences:\n- https://example.com/b",
+    "Mentions Reference: only inline, with no sources section",
+    "No sources at all.   \n\n",
+    "   \n  Leading whitespace and a heading split Sour",
+    "Sources:\n- https://example.com/only-links",
+]
+
+
+def stream(response, size):
+    parser = StreamingAnswerParser()
+    text = "".join(parser.feed(response[i:i + size]) for i in range(0, len(response), size))
+    rest, links = parser.finish()
+    return {"answer": text + rest, "links": links}, parser.answer
+
+
+@pytest.mark.parametrize("response", RESPONSES)
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 10_000])
+def test_streaming_matches_batch(response, size):
+    streamed, answer = stream(response, size)
+    assert streamed == parse_llm_response(response)
+    assert answer == streamed["answer"]
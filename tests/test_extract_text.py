@@ -0,0 +1,45 @@
+"""The regex fast path of extract_text must give exactly what the BeautifulSoup path gives."""
+import random
+
+import pytest
+from bs4 import BeautifulSoup
+
+from benchmarks.extract_benchmark import (MARKDOWN_SAMPLES, SAMPLES, soup_clean_html, soup_markdown_text,
+                                          synthetic_post)
+from extract_text import clean_html, extract_text_from_markdown, html_strings
+
+HTML = [
+    *SAMPLES,
+    "<p>attr with quote: <a title='it\"s' href=\"/x?y='1'\">q</a></p>",
+    "<p>&#0; &#x110000; &#128; &#65533; &amp;amp; &AMP; &nbsp&nbsp;</p>",
+    "<p>unclosed <b>bold <i>italic</p>",
+    "<P CLASS=x>UPPER</P><BR/>case",
+    "<p>a</p><template><p>hidden?</p></template>",
+    "<![CDATA[x]]><p>cdata</p>",
+    "text < 5 and > 3 without tags",
+    *(synthetic_post(random.Random(seed)) for seed in range(20)),
+]
+
+
+@pytest.mark.parametrize("html_content", HTML)
+def test_clean_html_matches_soup(html_content):
+    assert clean_html(html_content) == soup_clean_html(html_content)
+
+
+@pytest.mark.parametrize("html_content", HTML)
+def test_html_strings_match_soup(html_content):
+    strings = html_strings(html_content)
+    if strings is not None:
+        assert strings == list(BeautifulSoup(html_content, "html.parser").strings)
+
+
+def test_fast_path_is_taken_for_simple_html():
+    assert html_strings("<p>a<b>b</b>c &amp; d&nbsp;e</p>") == ["a", "b", "c & d\xa0e"]
+    assert all(html_strings(synthetic_post(random.Random(seed))) is not None for seed in range(20))
+
+
+@pytest.mark.parametrize("text", MARKDOWN_SAMPLES)
+def test_markdown_matches_soup(tmp_path, text):
+    path = tmp_path / "page.md"
+    path.write_text(text, encoding="utf-8")
+    assert extract_text_from_markdown(path) == soup_markdown_text(path)
@@ -0,0 +1,18 @@
+"""Serving cold start: `import app` stays within budget and doesn't load ingestion-only dependencies."""
+import statistics
+
+from benchmarks.import_benchmark import FORBIDDEN, loaded_modules, profile_import
+
+# Same budget as `python -m benchmarks.import_benchmark`
+BUDGET_MS = 1000
+
+
+def test_app_does_not_import_ingestion_dependencies():
+    modules = loaded_modules("app")
+    assert sorted(name for name in FORBIDDEN if name in modules) == []
+
+
+def test_app_import_time_within_budget():
+    totals_ms = [next(cum for depth, name, _, cum in profile_import("app") if depth == 0 and name == "app") / 1000
+                 for _ in range(3)]
+    assert statistics.median(totals_ms) <= BUDGET_MS